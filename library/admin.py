@@ -1,11 +1,19 @@
-from django.contrib import admin
+import os
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect, render
 
 # Register your models here.
 from django.utils import timezone
 from django.utils.html import format_html
 from django.conf import settings
+from django.urls import path, reverse
 from django.utils.translation import gettext_lazy as _
-from . import models
+from . import (autocomplete, bulk, changelist, circulation, exports, images, importer, jobs, models, refcache, routers,
+               search)
 
 admin.site.site_header = '***********图书管理**********'
 admin.site.site_title = '。。。。。图书管理。。。。。'
@@ -14,19 +22,53 @@ admin.site.index_title = 'home'
 
 def update_enabled(admin_model, request, queryset):
     """批量启用动作"""
-    queryset.update(status=2)
+    admin_model.update_status(request, queryset, 2)
 
 
 def update_disabled(admin_model, request, queryset):
     """批量禁用动作"""
-    queryset.update(status=-2)
+    admin_model.update_status(request, queryset, -2)
 
 
 update_enabled.short_description = '批量有效'
 update_disabled.short_description = '批量无效'
 
 
-class BaseAdmin(admin.ModelAdmin):
+def export_csv(admin_model, request, queryset):
+    """导出 CSV 动作，“全选”时导出列表当前筛选、检索的全部结果"""
+    return exports.csv_response(queryset, admin_model.export_columns, admin_model.export_filename(),
+                                admin_model.get_list_select_related(request) or ())
+
+
+def export_xlsx(admin_model, request, queryset):
+    """导出 Excel 动作"""
+    return exports.xlsx_response(queryset, admin_model.export_columns, admin_model.export_filename(),
+                                 admin_model.get_list_select_related(request) or ())
+
+
+export_csv.short_description = '导出 CSV'
+export_csv.allowed_permissions = ('view',)
+export_xlsx.short_description = '导出 Excel'
+export_xlsx.allowed_permissions = ('view',)
+
+
+class ExportMixin:
+    """导出动作，export_columns 见 library/exports.py"""
+
+    export_columns = ()
+
+    def export_filename(self):
+        return '%s-%s' % (self.model._meta.model_name, timezone.localdate().strftime('%Y%m%d'))
+
+    def report_querysets(self, request):
+        """导出时分块读取的查询（首块和后续的块），供 explain_admin 检查"""
+        select_related = set(self.get_list_select_related(request) or ()) | exports.related(self.export_columns)
+        queryset = self.get_queryset(request)
+        yield '导出', exports.chunk_query(queryset, select_related)
+        yield '导出后续分块', exports.chunk_query(queryset, select_related, last=exports.CHUNK_SIZE)
+
+
+class BaseAdmin(routers.ReplicaReadMixin, admin.ModelAdmin):
     """后台管理统一父类"""
 
     list_filter = ('status',)
@@ -43,6 +85,38 @@ class BaseAdmin(admin.ModelAdmin):
 
         super().save_model(request, obj, form, change)
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # 种类、书架的下拉框从缓存读取（见 library/refcache.py）
+        if db_field.related_model in refcache.MODELS:
+            kwargs.setdefault('form_class', refcache.CachedModelChoiceField)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def update_status(self, request, queryset, status):
+        """批量修改状态，分批提交，行数较多时转到后台执行"""
+        count = queryset.count()
+        if count > bulk.background_threshold():
+            job = bulk.enqueue_update_status(queryset, status, request.user.id)
+            self.message_user(request, '共 %d 条记录，已转到后台任务 %s 执行' % (count, job))
+            return
+        updated = bulk.update_status(queryset, status, request.user.id)
+        self.message_user(request, '已更新 %d 条记录' % updated)
+
+
+def category(obj):
+    """种类名称，从缓存读取"""
+    return refcache.display(models.Category, obj.category_id, None)
+
+
+def shelf(obj):
+    """书架号，从缓存读取"""
+    return refcache.display(models.Shelf, obj.shelf_id, None)
+
+
+category.short_description = '种类'
+category.admin_order_field = 'category'
+shelf.short_description = '书架'
+shelf.admin_order_field = 'shelf'
+
 
 @admin.register(models.Category)
 class CategoryAdmin(BaseAdmin):
@@ -58,26 +132,75 @@ class ShelfAdmin(BaseAdmin):
     """书架管理"""
 
     site_order = 2
-    list_display = ('code', 'location', 'category', 'floors', 'capacity', 'status')
+    list_display = ('code', 'location', category, 'floors', 'capacity', 'occupancy', 'over_capacity', 'status')
     fields = ('code', 'location', 'category', 'floors', 'capacity', 'status')
 
+    def get_queryset(self, request):
+        # 各层占用计数一次查询带出（见 library/shelves.py）
+        return super().get_queryset(request).prefetch_related('floor_counts')
+
+    def occupancy(self, obj):
+        count = sum(floor.count for floor in obj.floor_counts.all())
+        if not obj.capacity:
+            return count
+        return '%d / %d (%d%%)' % (count, obj.capacity, count * 100 // obj.capacity)
+
+    occupancy.short_description = '占用'
+
+    def over_capacity(self, obj):
+        """超出每层容量（总容量按层数平分）的层"""
+        per_floor = -(-obj.capacity // obj.floors) if obj.floors > 0 else obj.capacity
+        floors = sorted(floor.floor for floor in obj.floor_counts.all() if floor.count > per_floor)
+        if not floors:
+            return ''
+        return format_html('<span style="color:#ba2121">{}</span>', '、'.join('%d 层' % floor for floor in floors))
+
+    over_capacity.short_description = '超出容量'
+
+
+def thumbnail(name, placeholder, style):
+    """列表中的缩略图，按 1x/2x 提供衍生图，衍生图生成之前显示占位图"""
+    placeholder = settings.MEDIA_URL + placeholder
+    if not images.derivatives_exist(name):
+        return format_html('<img src="{}" style="{}">', placeholder, style)
+    small, large = [reverse('library:image', args=(size, name)) for size in images.preset(name)[0]]
+    return format_html('<img src="{}" srcset="{} 1x, {} 2x" onerror="this.srcset=\'\';this.src=\'{}\'" '
+                       'style="{}">', small, small, large, placeholder, style)
+
 
 def cover(obj):
-    return format_html(
-        '<img src="%s%s" onerror="this.src=\'%sbook.png\'" style="max-height:100px; max-width:100px">' %
-        (settings.MEDIA_URL, obj.cover, settings.MEDIA_URL))
+    return thumbnail(obj.cover.name, 'book.png', 'max-height:100px; max-width:100px')
 
 
 cover.short_description = '封面'
 
 
 @admin.register(models.Book)
-class BookAdmin(BaseAdmin):
+class BookAdmin(ExportMixin, autocomplete.AutocompleteMixin, BaseAdmin):
     """图书管理"""
     site_order = 3
-    list_display = ('name', cover, 'author', 'press', 'category', 'shelf', 'shelf_floor', 'score', 'status')
-    list_filter = ('status', 'category')
+    list_display = ('name', cover, 'author', 'press', category, shelf, 'shelf_floor', 'score', 'status')
+    # 种类、书架从缓存读取，不需要关联查询
+    list_select_related = ()
+    list_filter = ('status', ('category', refcache.CachedRelatedFieldListFilter))
     search_fields = ('name', 'author', 'press')
+    actions = BaseAdmin.actions + (export_csv, export_xlsx)
+    export_columns = (
+        ('ID', 'id'),
+        ('书名', 'name'),
+        ('版本', 'version'),
+        ('作者', 'author'),
+        ('翻译者', 'trans'),
+        ('出版社', 'press'),
+        ('ISBN', 'ISBN'),
+        ('价格', 'price'),
+        ('种类', category),
+        ('书架', shelf),
+        ('书架层数', 'shelf_floor'),
+        ('评分', 'score'),
+        ('书籍状态', 'book_status'),
+        ('状态', 'status'),
+    )
 
     fieldsets = (
         (
@@ -97,6 +220,65 @@ class BookAdmin(BaseAdmin):
         ),
     )
 
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='library_book_import'),
+            path('import/errors/<path:name>', self.admin_site.admin_view(self.import_errors_view),
+                 name='library_book_import_errors'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """上传导入文件，转到后台任务执行"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        if request.method == 'POST' and request.FILES.get('file'):
+            upload = request.FILES['file']
+            fmt = importer.guess_format(upload.name)
+            if fmt == 'xls':
+                self.message_user(request, '不支持旧版 Excel(.xls) 文件，请另存为 .xlsx 后再导入', messages.ERROR)
+            elif fmt not in importer.READERS:
+                self.message_user(request, '不支持的文件格式: %s' % upload.name, messages.ERROR)
+            else:
+                storage = importer.storage()
+                name = storage.save(upload.name, upload)
+                job = jobs.enqueue('import_books', path=storage.path(name), fmt=fmt)
+                url = reverse('admin:library_book_import_errors', args=(name,))
+                self.message_user(request, format_html(
+                    '已转到后台任务 {} 导入，完成后可下载<a href="{}">错误报告</a>', job, url))
+                return redirect('admin:library_book_changelist')
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='导入图书',
+        )
+        return render(request, 'admin/library/book/import.html', context)
+
+    def import_errors_view(self, request, name):
+        """下载导入的错误报告"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        storage = importer.storage()
+        try:
+            report = storage.path(name + '.errors.csv')
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(report):
+            raise Http404('错误报告尚未生成')
+        return FileResponse(open(report, 'rb'), as_attachment=True, filename=os.path.basename(report))
+
+    def get_search_results(self, request, queryset, search_term):
+        # 使用倒排索引检索（见 library/search.py），不做 LIKE 全表扫描
+        if not search_term.strip():
+            return queryset, False
+        return search.search(queryset, search_term), False
+
+    def get_ordering(self, request):
+        # 检索时按相关度和评分排序
+        if request.GET.get('q', '').strip():
+            return ('-search_rank', '-score')
+        return super().get_ordering(request)
+
 
 def fullname(obj):
     user = None
@@ -115,78 +297,246 @@ def fullname(obj):
 fullname.short_description = _('Fullname')
 
 
+class CheckOutForm(forms.ModelForm):
+    """新建借阅时用条件 UPDATE 占用图书（见 circulation.checkout_book），图书已被借出时显示为表单错误"""
+
+    # 由 CheckOutAdmin.get_form 设置
+    user_id = None
+
+    def clean(self):
+        cleaned_data = super().clean()
+        book = cleaned_data.get('book')
+        if self.instance.pk is not None or book is None or self.errors:
+            return cleaned_data
+        profile = cleaned_data.get('user_profile')
+        try:
+            checkout = circulation.checkout_book(book.pk, profile.pk if profile else None, self.user_id,
+                                                 cleaned_data.get('type') or 'SC')
+        except circulation.BookUnavailable:
+            self.add_error('book', '图书不在架，不能借出')
+            return cleaned_data
+        # 借阅已经新建，保存时用表单中的值更新这一行
+        self.instance.pk = checkout.pk
+        self.instance.book_status = checkout.book_status
+        self.instance.create_user_id = checkout.create_user_id
+        self.instance.create_time = checkout.create_time
+        return cleaned_data
+
+
 @admin.register(models.CheckOut)
-class CheckOutAdmin(admin.ModelAdmin):
+class CheckOutAdmin(changelist.KeysetPaginationMixin, ExportMixin, autocomplete.AutocompleteMixin,
+                    routers.ReplicaReadMixin, admin.ModelAdmin):
     """借阅管理"""
 
     site_order = 4
     list_filter = ('type',)
     list_display = ('user_profile', fullname, 'book', 'time', 'type', 'return_date', 'returned_time', 'allow_shift')
+    list_select_related = ('book', 'user_profile__user')
     fields = ('user_profile', 'book', 'time', 'type', 'return_date', 'returned_time', 'allow_shift')
     autocomplete_fields = ['book']
-    search_fields = ('user_profile', 'book')
+    # 实际检索见 get_search_results
+    search_fields = ('user_profile__user__username', 'user_profile__mobile', 'book__name', 'book__ISBN')
+    actions = (export_csv, export_xlsx)
+    export_columns = (
+        ('ID', 'id'),
+        ('用户', 'user_profile__user__username'),
+        ('姓名', fullname),
+        ('手机号', 'user_profile__mobile'),
+        ('书名', 'book__name'),
+        ('ISBN', 'book__ISBN'),
+        ('借阅时间', 'time'),
+        ('类型', 'type'),
+        ('归还日期', 'return_date'),
+        ('归还时间', 'returned_time'),
+        ('书籍状态', 'book_status'),
+    )
+
+    form = CheckOutForm
+    # 列表页上有按同样条件查看归档借阅的链接
+    change_list_template = 'admin/library/checkout/change_list.html'
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        form.user_id = request.user.id
+        return form
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.search_checkouts(queryset, search_term), False
 
 
 @admin.register(models.Comment)
-class CommentAdmin(BaseAdmin):
+class CommentAdmin(changelist.KeysetPaginationMixin, BaseAdmin):
     """书评管理"""
 
     site_order = 5
     list_display = ('checkout', 'score', 'content', 'status')
+    list_select_related = ('checkout__book', 'checkout__user_profile__user')
     fields = ('checkout', 'score', 'content', 'status')
     autocomplete_fields = ('checkout',)
 
 
 @admin.register(models.Note)
-class NoteAdmin(BaseAdmin):
+class NoteAdmin(changelist.KeysetPaginationMixin, BaseAdmin):
     """笔记管理"""
 
     site_order = 6
     list_display = ('checkout', 'page', 'content', 'status')
+    list_select_related = ('checkout__book', 'checkout__user_profile__user')
     fields = ('checkout', 'page', 'content', 'status')
     autocomplete_fields = ('checkout',)
 
 
 @admin.register(models.Rent)
-class RentAdmin(admin.ModelAdmin):
+class RentAdmin(changelist.KeysetPaginationMixin, ExportMixin, routers.ReplicaReadMixin, admin.ModelAdmin):
     """租阅管理"""
 
     site_order = 7
     list_filter = ('pay_status',)
     list_display = ('checkout', 'days', 'amount', 'pay_status')
+    list_select_related = ('checkout__book', 'checkout__user_profile__user')
+    actions = (export_csv, export_xlsx)
+    export_columns = (
+        ('ID', 'id'),
+        ('借阅 ID', 'checkout_id'),
+        ('用户', 'checkout__user_profile__user__username'),
+        ('书名', 'checkout__book__name'),
+        ('天数', 'days'),
+        ('金额', 'amount'),
+        ('订单号', 'order_no'),
+        ('交易号', 'trade_no'),
+        ('支付状态', 'pay_status'),
+        ('创建时间', 'create_time'),
+    )
     fields = ('checkout', 'days', 'amount', 'order_no', 'trade_no', 'pay_status')
     autocomplete_fields = ('checkout',)
 
 
 @admin.register(models.Shift)
-class ShiftAdmin(admin.ModelAdmin):
+class ShiftAdmin(routers.ReplicaReadMixin, admin.ModelAdmin):
     """转借管理"""
 
     site_order = 8
     list_filter = ('shift_status',)
     list_display = ('checkout', 'request_user_profile', 'agreed', 'shift_status', 'request_time')
+    list_select_related = ('checkout__book', 'checkout__user_profile__user', 'request_user_profile__user')
     fields = ('checkout', 'request_user_profile', 'reason', 'agreed', 'reply', 'shift_status',
               'request_time', 'reply_time', 'complete_time')
     autocomplete_fields = ('checkout', 'request_user_profile')
 
 
 def avatar(obj):
-    return format_html('<img src="%s%s" onerror="this.src=\'%suser.png\'" '
-                       'style="max-height:85px; max-width:85px; border-radius:50%%;">' %
-                       (settings.MEDIA_URL, obj.avatar, settings.MEDIA_URL))
+    return thumbnail(obj.avatar.name, 'user.png', 'max-height:85px; max-width:85px; border-radius:50%;')
 
 
 avatar.short_description = _('Avatar')
 
 
 @admin.register(models.UserProfile)
-class UserProfileAdmin(BaseAdmin):
+class UserProfileAdmin(autocomplete.AutocompleteMixin, BaseAdmin):
     """用户资料管理"""
 
     site_order = 10
     list_display = (avatar, 'user', fullname, 'mobile', 'sex', 'job', 'start_date', 'end_date', 'status')
+    list_select_related = ('user',)
     fields = ('user', 'mobile', 'sex', 'birth', 'job', 'avatar', 'start_date', 'end_date', 'status')
     autocomplete_fields = ('user',)
-    search_fields = ('user',)
+    # 实际检索见 get_search_results
+    search_fields = ('user__username', 'mobile')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(pk__in=search.search_profiles(search_term)), False
+
+
+@admin.register(models.Feedback)
+class FeedbackAdmin(changelist.KeysetPaginationMixin, BaseAdmin):
+    """意见反馈管理"""
+
+    site_order = 9
+    list_display = ('user_profile', 'content', 'reply_time', 'status')
+    list_select_related = ('user_profile__user',)
+    fields = ('user_profile', 'content', 'reply', 'reply_time', 'status')
+    autocomplete_fields = ('user_profile',)
+
+
+@admin.register(models.Job)
+class JobAdmin(admin.ModelAdmin):
+    """后台任务查看"""
+
+    site_order = 11
+    list_filter = ('state', 'kind')
+    list_display = ('id', 'kind', 'key', 'state', 'attempts', 'progress', 'create_time', 'finish_time')
+    readonly_fields = ('kind', 'key', 'payload', 'state', 'attempts', 'progress', 'error', 'create_time', 'start_time',
+                       'finish_time')
+
+    def has_add_permission(self, request):
+        return False
+
 
+class ArchiveInline(admin.TabularInline):
+    """归档的关联记录（只读）"""
 
+    extra = 0
+    can_delete = False
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedCommentInline(ArchiveInline):
+    model = models.ArchivedComment
+    fields = ('score', 'content', 'status', 'create_time')
+
+
+class ArchivedNoteInline(ArchiveInline):
+    model = models.ArchivedNote
+    fields = ('page', 'content', 'status', 'create_time')
+
+
+class ArchivedRentInline(ArchiveInline):
+    model = models.ArchivedRent
+    fields = ('days', 'amount', 'order_no', 'trade_no', 'pay_status', 'create_time')
+
+
+class ArchivedShiftInline(ArchiveInline):
+    model = models.ArchivedShift
+    fields = ('request_user_profile', 'reason', 'reply', 'shift_status', 'request_time', 'complete_time')
+
+
+@admin.register(models.ArchivedCheckOut)
+class ArchivedCheckOutAdmin(changelist.KeysetPaginationMixin, ExportMixin, routers.ReplicaReadMixin, admin.ModelAdmin):
+    """借阅归档（只读，见 library/archive.py）"""
+
+    site_order = 12
+    list_filter = ('type',)
+    list_display = ('id', 'user_profile', fullname, 'book', 'time', 'type', 'return_date', 'returned_time',
+                    'archive_time')
+    list_select_related = ('book', 'user_profile__user')
+    search_fields = CheckOutAdmin.search_fields
+    inlines = (ArchivedCommentInline, ArchivedNoteInline, ArchivedRentInline, ArchivedShiftInline)
+    actions = (export_csv, export_xlsx)
+    export_columns = CheckOutAdmin.export_columns
+    change_list_template = 'admin/library/archivedcheckout/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.search_checkouts(queryset, search_term), False
@@ -4,4 +4,7 @@ from django.utils.translation import gettext_lazy as _
 
 class LibraryConfig(AppConfig):
     name = 'library'
-    verbose_name = '图书管理系统'
\ No newline at end of file
+    verbose_name = '图书管理系统'
+
+    def ready(self):
+        from . import signals  # noqa: F401
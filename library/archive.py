@@ -0,0 +1,89 @@
+"""已结束借阅的归档
+
+归还超过 ARCHIVE_AFTER_DAYS 天的借阅连同其书评、笔记、租阅、转借一起移到 Archived* 表
+（保留原主键，归档表之间的外键关系与原表相同），借阅相关的表只保留近期数据。
+还有待支付租金或未完成转借的借阅不归档。
+
+按主键分批处理，每批一个事务：锁定借阅和依赖它的记录、复制到归档表、按主键 DELETE 原记录。
+删除不触发信号——归档不是删除，图书评分、借还统计同时读取归档表（见 scores.py、rollups.py），结果不变。
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import autocomplete, models
+
+# (原表, 归档表)，依赖借阅的表在前
+DEPENDENTS = (
+    (models.Comment, models.ArchivedComment),
+    (models.Note, models.ArchivedNote),
+    (models.Rent, models.ArchivedRent),
+    (models.Shift, models.ArchivedShift),
+)
+# 未结束的租阅、转借
+OPEN_RENT = {'pay_status': 1}
+OPEN_SHIFT = {'shift_status__in': ('Req', 'Arg')}
+
+
+def archive_days():
+    return getattr(settings, 'ARCHIVE_AFTER_DAYS', 365)
+
+
+def closed(cutoff):
+    """归还时间早于 cutoff、没有未结束租阅和转借的借阅"""
+    rents = models.Rent.all_objects.filter(checkout__isnull=False, **OPEN_RENT).values('checkout_id')
+    shifts = models.Shift.all_objects.filter(checkout__isnull=False, **OPEN_SHIFT).values('checkout_id')
+    return models.CheckOut.all_objects.filter(returned_time__lt=cutoff) \
+        .exclude(pk__in=rents).exclude(pk__in=shifts)
+
+
+def copy(obj, archived):
+    """按字段名复制到归档模型（包括主键）"""
+    return archived(**{field.attname: getattr(obj, field.attname) for field in obj._meta.concrete_fields})
+
+
+def delete(model, pks, batch_size=500):
+    """按主键执行 DELETE（不收集关联对象、不触发信号），返回删除的行数"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    deleted = 0
+    with connection.cursor() as cursor:
+        for i in range(0, len(pks), batch_size):
+            batch = pks[i:i + batch_size]
+            cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (table, column, ', '.join(['%s'] * len(batch))),
+                           batch)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def archive_batch(pks, cutoff):
+    """归档一批借阅，返回归档的借阅数"""
+    with transaction.atomic():
+        # 加锁后再确认一次，期间可能新建了租阅或转借
+        loans = list(closed(cutoff).select_for_update().filter(pk__in=pks))
+        if not loans:
+            return 0
+        ids = [loan.pk for loan in loans]
+        models.ArchivedCheckOut.all_objects.bulk_create([copy(loan, models.ArchivedCheckOut) for loan in loans])
+        for model, archived in DEPENDENTS:
+            rows = list(model.all_objects.select_for_update().filter(checkout_id__in=ids).order_by('pk'))
+            archived.all_objects.bulk_create([copy(row, archived) for row in rows])
+            delete(model, [row.pk for row in rows])
+        delete(models.CheckOut, ids)
+        transaction.on_commit(lambda: autocomplete.bump(models.CheckOut))
+    return len(ids)
+
+
+def archive(days=None, batch_size=500, now=None):
+    """按批归档，逐批返回 (检查数, 归档数)"""
+    days = archive_days() if days is None else days
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=days)
+    last = 0
+    while True:
+        pks = list(closed(cutoff).filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        last = pks[-1]
+        yield len(pks), archive_batch(pks, cutoff)
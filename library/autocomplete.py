@@ -0,0 +1,113 @@
+"""后台自动完成（autocomplete_fields）接口
+
+代替 admin 自带的自动完成视图：检索走各 ModelAdmin.get_search_results 中的索引
+（图书倒排索引、用户名和手机号前缀，见 library/search.py），多取一条判断是否还有下一页，
+不做 COUNT；结果按 (模型, 版本, 关键字, 页码) 缓存 AUTOCOMPLETE_CACHE_SECONDS 秒。
+模型（及其显示文字依赖的模型）修改后递增版本号，旧结果不再使用；
+只修改了与检索、显示文字、排序无关的字段（如登录时间、归还时间）时不失效。
+
+返回 select2 的格式，另外带上请求的 term，前端可以丢弃过期的响应。
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+
+from . import models
+
+PAGE_SIZE = 20
+
+# 模型修改后需要失效的自动完成结果：{模型: {自动完成的模型: 影响其结果的字段}}
+# 借阅的显示文字包含书名和用户名，检索包含图书索引、用户名、姓名和手机号
+DEPENDENTS = {
+    models.Book: {
+        models.Book: ('name', 'author', 'trans', 'press', 'ISBN', 'status', 'score'),
+        models.CheckOut: ('name', 'author', 'trans', 'press', 'ISBN'),
+    },
+    models.CheckOut: {
+        models.CheckOut: ('user_profile', 'book', 'status'),
+    },
+    models.UserProfile: {
+        models.UserProfile: ('user', 'mobile', 'name_key', 'status'),
+        models.CheckOut: ('user', 'mobile', 'name_key'),
+    },
+    User: {
+        models.UserProfile: ('username', 'first_name', 'last_name'),
+        models.CheckOut: ('username', 'first_name', 'last_name'),
+    },
+}
+
+
+def cache_seconds():
+    return getattr(settings, 'AUTOCOMPLETE_CACHE_SECONDS', 60)
+
+
+def version_key(model):
+    return 'autocomplete:%s:version' % model._meta.label_lower
+
+
+def watched_fields(model):
+    """影响自动完成结果的字段名"""
+    return {name for fields in DEPENDENTS.get(model, {}).values() for name in fields}
+
+
+def bump(model, changed=None):
+    """模型修改后使相关的自动完成结果失效，changed 为修改的字段名（None 表示新建、删除或未知）"""
+    for dependent, fields in DEPENDENTS.get(model, {}).items():
+        if changed is not None and not set(fields) & set(changed):
+            continue
+        try:
+            cache.incr(version_key(dependent))
+        except ValueError:
+            cache.add(version_key(dependent), 1, None)
+
+
+def result_key(model, term, page):
+    version = cache.get(version_key(model), 0)
+    digest = hashlib.md5(term.encode()).hexdigest()
+    return 'autocomplete:%s:%s:%s:%d' % (model._meta.label_lower, version, digest, page)
+
+
+class AutocompleteMixin:
+    """带缓存的自动完成视图"""
+
+    def autocomplete_view(self, request):
+        if not self.get_search_fields(request) or not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        term = request.GET.get('term', '').strip()
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+
+        key = result_key(self.model, term, page)
+        data = cache.get(key)
+        if data is None:
+            results, more = self.autocomplete_results(request, term, page)
+            data = {'results': results, 'pagination': {'more': more}}
+            cache.set(key, data, cache_seconds())
+
+        response = JsonResponse(dict(data, term=term))
+        response['Cache-Control'] = 'private, max-age=%d' % cache_seconds()
+        return response
+
+    def autocomplete_results(self, request, term, page):
+        """返回 (结果列表, 是否还有下一页)"""
+        queryset = self.get_queryset(request)
+        select_related = self.get_list_select_related(request)
+        if select_related and select_related is not True:
+            queryset = queryset.select_related(*select_related)
+        if term:
+            queryset, use_distinct = self.get_search_results(request, queryset, term)
+            if use_distinct:
+                queryset = queryset.distinct()
+        if not term or not queryset.ordered:
+            queryset = queryset.order_by(*(self.get_ordering(request) or ('-pk',)))
+
+        start = (page - 1) * PAGE_SIZE
+        objs = list(queryset[start:start + PAGE_SIZE + 1])
+        results = [{'id': str(obj.pk), 'text': str(obj)} for obj in objs[:PAGE_SIZE]]
+        return results, len(objs) > PAGE_SIZE
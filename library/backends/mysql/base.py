@@ -0,0 +1,38 @@
+"""带连接池的 MySQL 引擎（见 library/pool.py）
+
+    'ENGINE': 'library.backends.mysql',
+
+Django 打开连接时从连接池借出，关闭连接（请求结束、CONN_MAX_AGE 到期、出错）时归还。
+"""
+from functools import partial
+
+from django.db.backends.mysql import base
+from django.db.backends.mysql.base import Database
+
+from library import pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    connection_pool = None
+
+    def get_new_connection(self, conn_params):
+        # 按实际连接的库区分连接池（测试时 NAME 会换成测试库）
+        host = conn_params.get('host') or conn_params.get('unix_socket', '')
+        name = '%s:%s@%s:%s' % (self.alias, conn_params.get('db'), host, conn_params.get('port', ''))
+        self.connection_pool = pool.get(name, self.settings_dict, partial(Database.connect, **conn_params),
+                                        lambda conn: conn.ping())
+        return self.connection_pool.acquire()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # 事务中关闭或出过错的连接不再放回池中；未提交的事务先回滚
+        discard = self.in_atomic_block or self.errors_occurred
+        if not discard and not self.autocommit:
+            try:
+                self.connection.rollback()
+            except Database.Error:
+                discard = True
+        with self.wrap_database_errors:
+            self.connection_pool.release(self.connection, discard)
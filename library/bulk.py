@@ -0,0 +1,135 @@
+"""批量修改状态
+
+按主键分批执行，每批一个短事务，同时写入 update_user_id/update_time，
+避免“全选”时一条 UPDATE 长时间持有大量行锁。
+超过 BULK_BACKGROUND_THRESHOLD 行时转为后台任务执行。
+"""
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import jobs, models, refcache, scores, shelves
+
+logger = logging.getLogger(__name__)
+
+
+def batch_size():
+    return getattr(settings, 'BULK_BATCH_SIZE', 500)
+
+
+def background_threshold():
+    return getattr(settings, 'BULK_BACKGROUND_THRESHOLD', 5000)
+
+
+def rebuild_comment_scores(pks):
+    """评论状态变化后重建相关图书的评分"""
+    book_ids = models.Comment.all_objects.filter(pk__in=pks).exclude(checkout__book=None) \
+        .values_list('checkout__book_id', flat=True).distinct()
+    scores.rebuild_scores(list(book_ids))
+
+
+def reconcile_shelves(pks):
+    """图书状态变化后重新统计相关书架的占用"""
+    shelf_ids = models.Book.all_objects.filter(pk__in=pks).exclude(shelf=None) \
+        .values_list('shelf_id', flat=True).distinct()
+    shelves.reconcile(list(shelf_ids))
+
+
+def invalidate_reference(model):
+    """种类、书架状态变化后（事务提交后）使参考数据缓存失效"""
+    def after_batch(pks):
+        transaction.on_commit(lambda: refcache.bump(model))
+    return after_batch
+
+
+# 每批更新之后的处理（批量 UPDATE 不会触发信号）
+AFTER_BATCH = {
+    models.Comment: rebuild_comment_scores,
+    models.Book: reconcile_shelves,
+    models.Category: invalidate_reference(models.Category),
+    models.Shelf: invalidate_reference(models.Shelf),
+}
+
+
+def update_status(queryset, status, user_id, progress=None):
+    """分批修改 queryset 中记录的状态，返回修改的行数
+
+    progress(已修改行数) 在每批提交后调用。
+    """
+    return update_batches(queryset.model, pk_batches(queryset), status, user_id, progress)
+
+
+def pk_batches(queryset):
+    """按主键顺序逐批返回 queryset 的主键"""
+    size = batch_size()
+    last = None
+    while True:
+        page = queryset.order_by('pk')
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        pks = list(page.values_list('pk', flat=True)[:size])
+        if not pks:
+            break
+        last = pks[-1]
+        yield pks
+
+
+def pk_ranges(queryset):
+    """queryset 的主键压缩为连续区间 [[起, 止], ...]"""
+    ranges = []
+    for pks in pk_batches(queryset):
+        for pk in pks:
+            if ranges and pk == ranges[-1][1] + 1:
+                ranges[-1][1] = pk
+            else:
+                ranges.append([pk, pk])
+    return ranges
+
+
+def range_batches(ranges):
+    """把主键区间展开，逐批返回主键"""
+    size = batch_size()
+    pks = []
+    for start, end in ranges:
+        for pk in range(start, end + 1):
+            pks.append(pk)
+            if len(pks) >= size:
+                yield pks
+                pks = []
+    if pks:
+        yield pks
+
+
+def update_batches(model, batches, status, user_id, progress=None):
+    after_batch = AFTER_BATCH.get(model)
+    updated = 0
+    for pks in batches:
+        with transaction.atomic():
+            updated += model._default_manager.filter(pk__in=pks).update(
+                status=status, update_user_id=user_id, update_time=timezone.now())
+            if after_batch:
+                after_batch(pks)
+        if progress:
+            progress(updated)
+    return updated
+
+
+def enqueue_update_status(queryset, status, user_id):
+    """转为后台任务执行，任务参数只保存入队时选中记录的主键区间"""
+    return jobs.enqueue('bulk_status', model=queryset.model._meta.label, ranges=pk_ranges(queryset),
+                        status=status, user_id=user_id)
+
+
+@jobs.register('bulk_status', bind=True)
+def run_update_status(job, model, ranges, status, user_id):
+    """后台执行批量修改状态，进度记录在任务上"""
+    model = apps.get_model(model)
+
+    def progress(updated):
+        models.Job.objects.filter(pk=job.pk).update(progress=updated)
+        logger.info('任务 %r 已更新 %d 行', job, updated)
+
+    return update_batches(model, range_batches(ranges), status, user_id, progress)
@@ -0,0 +1,213 @@
+"""大表后台列表页的分页
+
+按排序字段和主键的游标翻页（WHERE (排序字段, pk) < 上一页最后一行），
+不使用 OFFSET，翻到多深都只读一页的行。总数不做精确 COUNT：
+没有筛选条件时读取表的统计信息，有筛选条件时最多数到 ADMIN_EXACT_COUNT_THRESHOLD 行，
+超过的显示为估计值，点击“精确计数”时才执行 COUNT(*)。
+
+排序包含可为空的字段、关联字段或表达式时无法按游标翻页，回到普通分页（总数同样是估计值）。
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+AFTER_VAR = '_after'
+BEFORE_VAR = '_before'
+EXACT_VAR = '_exact'
+
+
+def count_threshold():
+    return getattr(settings, 'ADMIN_EXACT_COUNT_THRESHOLD', 10000)
+
+
+def table_rows(model, using):
+    """表统计信息中的估计行数，数据库不支持时返回 None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                           'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """总数超过阈值时使用估计值的分页器"""
+
+    exact = False
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if self.exact:
+            return queryset.count()
+        threshold = count_threshold()
+        if not queryset.query.where:
+            rows = table_rows(queryset.model, queryset.db)
+            if rows is not None and rows > threshold:
+                self.estimated = True
+                return rows
+        # 最多数到 threshold + 1 行
+        count = queryset.order_by()[:threshold + 1].count()
+        if count > threshold:
+            self.estimated = True
+        return count
+
+
+def encode(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode(token):
+    return json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+
+
+class KeysetChangeList(ChangeList):
+    """按游标翻页的列表页"""
+
+    keyset = False
+    count_estimated = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 排序、筛选链接不带游标
+        for name in (AFTER_VAR, BEFORE_VAR, EXACT_VAR):
+            self.params.pop(name, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for name in (AFTER_VAR, BEFORE_VAR, EXACT_VAR):
+            lookup_params.pop(name, None)
+        return lookup_params
+
+    def keyset_fields(self, request):
+        """可以按游标翻页时返回 [(字段, 是否倒序), ...]，否则返回 None"""
+        opts = self.lookup_opts
+        fields = []
+        for name in self.get_ordering(request, self.root_queryset):
+            if not isinstance(name, str):
+                return None
+            desc = name.startswith('-')
+            name = name.lstrip('-')
+            field = opts.pk if name == 'pk' else None
+            if field is None:
+                try:
+                    field = opts.get_field(name)
+                except Exception:
+                    return None
+            if not field.concrete or field.is_relation or field.null:
+                return None
+            if any(field == seen for seen, _ in fields):
+                continue
+            fields.append((field, desc))
+        if not any(field.primary_key for field, desc in fields):
+            fields.append((opts.pk, True))
+        return fields
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        paginator.exact = EXACT_VAR in request.GET
+        self.result_count = paginator.count
+        self.count_estimated = paginator.estimated
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.can_show_all = not paginator.estimated and self.result_count <= self.list_max_show_all
+        self.multi_page = self.result_count > self.list_per_page
+        self.paginator = paginator
+        if not paginator.exact:
+            self.exact_count_url = self.get_query_string({EXACT_VAR: 1})
+
+        fields = self.keyset_fields(request)
+        if (self.show_all and self.can_show_all) or not self.multi_page:
+            self.result_list = self.queryset._clone()
+        elif fields is None:
+            try:
+                self.result_list = paginator.page(self.page_num + 1).object_list
+            except InvalidPage:
+                raise IncorrectLookupParameters
+        else:
+            self.keyset = True
+            self.result_list = self.seek(request, fields)
+
+    def seek(self, request, fields):
+        """取游标之后（或之前）的一页，并生成翻页链接"""
+        after = request.GET.get(AFTER_VAR)
+        before = request.GET.get(BEFORE_VAR)
+        backward = before is not None
+        token = before if backward else after
+        # 向前翻页时反向排序，取出后再倒回来
+        direction = [(field, desc != backward) for field, desc in fields]
+        queryset = self.queryset.order_by(*[('-' if desc else '') + field.attname for field, desc in direction])
+        if token:
+            try:
+                values = [field.to_python(value) for (field, desc), value in zip(fields, decode(token))]
+            except Exception:
+                raise IncorrectLookupParameters
+            if len(values) != len(fields):
+                # 排序已改变，游标失效
+                raise IncorrectLookupParameters
+            queryset = queryset.filter(self.seek_filter(direction, values))
+
+        rows = list(queryset[:self.list_per_page + 1])
+        more = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+        if backward:
+            rows.reverse()
+            has_previous, has_next = more, bool(before)
+            if not before:
+                # 末页
+                self.page_num = max(self.paginator.num_pages - 1, 0)
+        else:
+            has_previous, has_next = bool(after), more
+
+        remove = [AFTER_VAR, BEFORE_VAR]
+        self.first_url = self.get_query_string({PAGE_VAR: None}, remove) if has_previous else None
+        self.last_url = self.get_query_string({BEFORE_VAR: ''}, [AFTER_VAR, PAGE_VAR]) if has_next else None
+        self.previous_url = self.next_url = None
+        if rows and has_previous:
+            self.previous_url = self.get_query_string(
+                {BEFORE_VAR: self.token(rows[0], fields), PAGE_VAR: max(self.page_num - 1, 0)}, remove)
+        if rows and has_next:
+            self.next_url = self.get_query_string(
+                {AFTER_VAR: self.token(rows[-1], fields), PAGE_VAR: self.page_num + 1}, remove)
+        return rows
+
+    @staticmethod
+    def token(obj, fields):
+        return encode([field.value_to_string(obj) for field, desc in fields])
+
+    @staticmethod
+    def seek_filter(fields, values):
+        """按字典序排在游标之后的行：(a, b) > (x, y) 即 a > x 或 (a = x 且 b > y)"""
+        condition = Q()
+        for i, (field, desc) in enumerate(fields):
+            step = Q(**{'%s__%s' % (field.attname, 'lt' if desc else 'gt'): values[i]})
+            for (previous, _), value in zip(fields[:i], values[:i]):
+                step &= Q(**{previous.attname: value})
+            condition |= step
+        return condition
+
+
+class KeysetPaginationMixin:
+    """大表的列表页：游标翻页、估计总数"""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/library/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
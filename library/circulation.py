@@ -0,0 +1,148 @@
+"""借还业务"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import models, rollups, shelves
+
+# 逾期费用对应的租阅订单号前缀，每笔借阅最多一条
+OVERDUE_ORDER_PREFIX = 'OD'
+
+# 可以借出的图书状态（归还后未上架的也可以直接借出）
+AVAILABLE = ('ON', 'RE')
+
+
+class BookUnavailable(Exception):
+    """图书不存在、无效或不在架"""
+
+
+def overdue_fee():
+    """每逾期一天的费用"""
+    return Decimal(str(getattr(settings, 'OVERDUE_FEE_PER_DAY', '0.50')))
+
+
+def overdue_order_no(checkout_id):
+    return '%s%d' % (OVERDUE_ORDER_PREFIX, checkout_id)
+
+
+def charge_overdue(today=None, chunk_size=1000):
+    """为逾期未还的借阅生成或更新逾期费用
+
+    按主键分块遍历逾期借阅，每块在一个事务中批量新建、更新对应的 Rent，
+    已支付的不再修改；重复执行不会重复收费。逐块返回 (扫描数, 新建数, 更新数)。
+    """
+    today = today or timezone.localdate()
+    fee = overdue_fee()
+    last = 0
+    while True:
+        rows = list(models.CheckOut.objects
+                    .filter(returned_time=None, return_date__lt=today, pk__gt=last)
+                    .order_by('pk').values_list('pk', 'return_date')[:chunk_size])
+        if not rows:
+            break
+        last = rows[-1][0]
+
+        with transaction.atomic():
+            existing = {
+                rent.checkout_id: rent
+                for rent in models.Rent.all_objects.filter(
+                    checkout_id__in=[pk for pk, return_date in rows],
+                    order_no__in=[overdue_order_no(pk) for pk, return_date in rows])
+            }
+            now = timezone.now()
+            created = []
+            updated = []
+            for pk, return_date in rows:
+                days = (today - return_date).days
+                amount = fee * days
+                rent = existing.get(pk)
+                if rent is None:
+                    created.append(models.Rent(checkout_id=pk, days=days, amount=amount,
+                                               order_no=overdue_order_no(pk), pay_status=1))
+                elif rent.pay_status != 2 and (rent.days != days or rent.amount != amount):
+                    rent.days = days
+                    rent.amount = amount
+                    rent.update_time = now
+                    updated.append(rent)
+            models.Rent.objects.bulk_create(created)
+            models.Rent.all_objects.bulk_update(updated, ['days', 'amount', 'update_time'])
+            # 批量写入不触发信号，单独登记统计日期
+            stale = {rollups.local_day(now)} if created else set()
+            for rent in updated:
+                stale |= rollups.days_of(rent)
+            rollups.mark(stale)
+        yield len(rows), len(created), len(updated)
+
+
+def checkout_book(book_id, user_profile_id, user_id=None, type='SC'):
+    """借书，返回新建的借阅
+
+    用一条条件 UPDATE 把图书改为借出，更新到一行才算借到，并在同一个事务中新建借阅。
+    不先查询再修改，也不锁表，并发借同一本书时只有一个成功，其余抛出 BookUnavailable。
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        for book_status in AVAILABLE:
+            if models.Book.objects.filter(pk=book_id, book_status=book_status).update(
+                    book_status='OUT', update_user_id=user_id, update_time=now):
+                break
+        else:
+            raise BookUnavailable(book_id)
+        if book_status in shelves.OCCUPYING:
+            # 条件更新不触发信号，单独扣除书架占用
+            shelf_id, floor = models.Book.objects.filter(pk=book_id).values_list('shelf_id', 'shelf_floor').get()
+            if shelf_id is not None:
+                shelves.change(shelf_id, floor, -1)
+        return models.CheckOut.objects.create(
+            book_id=book_id, user_profile_id=user_profile_id, type=type, book_status='OUT', time=now,
+            return_date=timezone.localtime(models.calc_return_date()).date(), create_user_id=user_id,
+            create_time=now)
+
+
+def return_books(codes, user_id=None):
+    """扫码还书，codes 为按扫描顺序排列的一批条码（ISBN）
+
+    一次查询（走 Book.ISBN 索引）锁定这批条码对应的未归还借阅，同一 ISBN 有多册借出时
+    先还借得最早的；在同一个事务中设置归还时间，借阅和图书的状态改为“归还”。
+    按扫描顺序返回每个条码的结果，供还书页显示。
+    """
+    isbns = [models.clean_isbn(code) for code in codes]
+    now = timezone.now()
+    today = timezone.localdate()
+    results = []
+    book_ids = []
+    with transaction.atomic():
+        loans = {}
+        for loan in (models.CheckOut.all_objects.select_for_update()
+                     .filter(returned_time=None, book__ISBN__in=set(isbns))
+                     .order_by('time', 'pk')
+                     .values('pk', 'book_id', 'book__ISBN', 'book__name', 'return_date',
+                             'user_profile__user__username')):
+            loans.setdefault(loan['book__ISBN'], []).append(loan)
+
+        for code, isbn in zip(codes, isbns):
+            if not loans.get(isbn):
+                results.append({'code': code, 'ok': False, 'message': '没有未归还的借阅'})
+                continue
+            loan = loans[isbn].pop(0)
+            book_ids.append(loan['book_id'])
+            results.append({
+                'code': code,
+                'ok': True,
+                'checkout': loan['pk'],
+                'book': loan['book__name'],
+                'user': loan['user_profile__user__username'] or '',
+                'overdue_days': max((today - loan['return_date']).days, 0),
+                'message': '已归还',
+            })
+
+        returned = [result['checkout'] for result in results if result['ok']]
+        if returned:
+            models.CheckOut.all_objects.filter(pk__in=returned).update(
+                returned_time=now, book_status='RE', update_user_id=user_id, update_time=now)
+            models.Book.all_objects.filter(pk__in=book_ids).update(
+                book_status='RE', update_user_id=user_id, update_time=now)
+            rollups.mark({today})
+    return results
@@ -0,0 +1,231 @@
+"""封面和头像的衍生图缓存
+
+上传时只保存原图。衍生图按（原图内容哈希, 尺寸, 格式）缓存在媒体目录的
+cache/ 下：上传后由后台任务预先生成常用尺寸，其余的在第一次请求时生成；
+缓存总大小超过 IMAGE_CACHE_MAX_BYTES 时按最近访问时间淘汰：预生成和请求时生成的
+衍生图都登记到 ImageDerivative，每个进程每登记 EVICT_EVERY 个排队一次淘汰任务，
+请求中不统计缓存总大小。
+"""
+import hashlib
+import itertools
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import jobs, models
+
+CACHE_DIR = 'cache'
+# 各目录下图片的衍生尺寸，以及是否裁剪为正方形
+PRESETS = {
+    'book': ((100, 200), False),
+    'user': ((85, 170), True),
+}
+FORMATS = {
+    'png': 'PNG',
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'webp': 'WEBP',
+}
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+# 最近访问时间的更新间隔，避免每次读取都写数据库
+TOUCH_INTERVAL = timedelta(hours=1)
+# 每个进程每登记这么多个衍生图检查一次缓存大小
+EVICT_EVERY = 100
+
+_registered = itertools.count(1)
+
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+_hashes = {}
+
+
+def max_cache_bytes():
+    return getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+
+def preset(name):
+    """原图所属的尺寸配置: (sizes, crop)，不支持衍生图时返回 None"""
+    return PRESETS.get(str(name).split('/', 1)[0])
+
+
+def source_path(name):
+    return os.path.join(settings.MEDIA_ROOT, str(name))
+
+
+def source_hash(name):
+    """原图内容的哈希，按文件修改时间和大小在进程内缓存"""
+    stem = os.path.splitext(os.path.basename(str(name)))[0]
+    if BLOB_NAME.match(stem):
+        # 内容寻址保存的文件，文件名就是哈希
+        return stem
+    path = source_path(name)
+    stat = os.stat(path)
+    memo = (path, stat.st_mtime, stat.st_size)
+    if memo not in _hashes:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                sha.update(chunk)
+        _hashes[memo] = sha.hexdigest()
+    return _hashes[memo]
+
+
+def default_format(name):
+    """与原图一致的输出格式"""
+    ext = os.path.splitext(str(name))[1].lower().lstrip('.')
+    return 'jpg' if FORMATS.get(ext) == 'JPEG' else 'png'
+
+
+def derivative_name(digest, size, fmt, crop=False):
+    """衍生图在媒体目录中的相对路径"""
+    return '%s/%s/%s_%d%s.%s' % (CACHE_DIR, digest[:2], digest, size, 'c' if crop else '', fmt)
+
+
+def render(source, target, size, fmt, crop=False):
+    """生成一张衍生图（不访问数据库，可在进程池中执行）"""
+    from PIL import Image
+
+    img = Image.open(source)
+    if crop:
+        edge = min(img.width, img.height)
+        left = (img.width - edge) / 2
+        top = (img.height - edge) / 2
+        img = img.crop((left, top, left + edge, top + edge)).resize((size, size), resample=Image.BICUBIC)
+    else:
+        img.thumbnail([size, size])
+    if FORMATS[fmt] == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # 先写临时文件再替换，避免读到写了一半的图片
+    temp = '%s.%d.tmp' % (target, os.getpid())
+    img.save(temp, format=FORMATS[fmt])
+    os.replace(temp, target)
+    return os.path.getsize(target)
+
+
+def derivatives_exist(name):
+    """上传后预生成的衍生图是否已就绪"""
+    config = preset(name)
+    if not name or config is None or not os.path.exists(source_path(name)):
+        return False
+    sizes, crop = config
+    digest = source_hash(name)
+    return os.path.exists(source_path(derivative_name(digest, sizes[0], default_format(name), crop)))
+
+
+def enqueue_derivatives(name):
+    """为新上传的图片排队预生成衍生图"""
+    if preset(name) is None:
+        return None
+    return jobs.enqueue('thumbnail', key='thumbnail:%s' % name, name=name)
+
+
+def registered(count=1):
+    """本进程又登记了 count 个衍生图，每 EVICT_EVERY 个排队一次淘汰任务"""
+    due = [next(_registered) % EVICT_EVERY == 0 for _ in range(count)]
+    if any(due):
+        jobs.enqueue('evict_images', key='evict_images')
+
+
+def register_derivatives(entries):
+    """登记预生成的衍生图 [(路径, 大小), ...]，纳入缓存大小统计和淘汰"""
+    keys = [key for key, size_bytes in entries]
+    existing = set(models.ImageDerivative.objects.filter(key__in=keys).values_list('key', flat=True))
+    now = timezone.now()
+    created = models.ImageDerivative.objects.bulk_create([
+        models.ImageDerivative(key=key, bytes=size_bytes, last_access=now)
+        for key, size_bytes in entries if key not in existing
+    ], ignore_conflicts=True)
+    if created:
+        registered(len(created))
+
+
+@jobs.register('thumbnail', process=True, done=register_derivatives)
+def make_derivatives(name):
+    """预生成常用尺寸和格式的衍生图（在进程池中执行），返回 [(路径, 大小), ...] 供登记"""
+    sizes, crop = preset(name)
+    digest = source_hash(name)
+    entries = []
+    for size in sizes:
+        for fmt in (default_format(name), 'webp'):
+            key = derivative_name(digest, size, fmt, crop)
+            target = source_path(key)
+            if os.path.exists(target):
+                entries.append((key, os.path.getsize(target)))
+            else:
+                entries.append((key, render(source_path(name), target, size, fmt, crop)))
+    return entries
+
+
+def get_derivative(name, size, fmt):
+    """取得衍生图的相对路径，缓存中没有时立即生成"""
+    sizes, crop = preset(name)
+    digest = source_hash(name)
+    key = derivative_name(digest, size, fmt, crop)
+    now = timezone.now()
+
+    entry = models.ImageDerivative.objects.filter(key=key).first()
+    if entry is not None and os.path.exists(source_path(key)):
+        if now - entry.last_access > TOUCH_INTERVAL:
+            models.ImageDerivative.objects.filter(pk=entry.pk).update(last_access=now)
+        return key
+
+    path = source_path(key)
+    if os.path.exists(path):
+        # 预生成后尚未登记的文件（如登记前 worker 退出），第一次访问时登记
+        size_bytes = os.path.getsize(path)
+    else:
+        size_bytes = render(source_path(name), path, size, fmt, crop)
+    try:
+        entry, created = models.ImageDerivative.objects.update_or_create(
+            key=key, defaults={'bytes': size_bytes, 'last_access': now})
+    except IntegrityError:
+        # 并发请求已登记
+        created = False
+    if created:
+        registered()
+    return key
+
+
+@jobs.register('evict_images')
+def run_evict():
+    """后台检查缓存大小并淘汰"""
+    return evict()
+
+
+def evict(limit=None):
+    """缓存总大小超过上限时，按最近访问时间淘汰到上限的 90%"""
+    limit = max_cache_bytes() if limit is None else limit
+    total = models.ImageDerivative.objects.aggregate(total=Sum('bytes'))['total'] or 0
+    if total <= limit:
+        return 0
+
+    removed = 0
+    target = limit * 0.9
+    entries = models.ImageDerivative.objects.order_by('last_access').values_list('pk', 'key', 'bytes')
+    while total > target:
+        evicted = []
+        for pk, key, size_bytes in entries[:100]:
+            if total <= target:
+                break
+            try:
+                os.remove(source_path(key))
+            except FileNotFoundError:
+                pass
+            total -= size_bytes
+            evicted.append(pk)
+        if not evicted:
+            break
+        models.ImageDerivative.objects.filter(pk__in=evicted).delete()
+        removed += len(evicted)
+    return removed
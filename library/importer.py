@@ -0,0 +1,252 @@
+"""图书批量导入
+
+逐行读取 CSV / Excel(xlsx) / MARC(ISO 2709) 文件，按名称、编号在内存中对照
+种类和书架，校验后按 ISBN 批量新建或更新。每批一个事务，提交后把已处理的
+行号写入检查点文件，中断后可以从检查点继续；校验失败的行写入错误报告。
+
+Excel 需要安装 openpyxl，MARC 需要安装 pymarc。
+"""
+import csv
+import json
+import logging
+import os
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+from . import autocomplete, jobs, models, refcache, search, shelves
+
+logger = logging.getLogger(__name__)
+
+# 字段及文件中可用的列名
+COLUMNS = {
+    'name': ('name', '书名', '名字'),
+    'version': ('version', '版本'),
+    'author': ('author', '作者'),
+    'trans': ('trans', '翻译者', '译者'),
+    'press': ('press', '出版社'),
+    'ISBN': ('isbn', '国际标准图书编号'),
+    'total_page': ('total_page', '总页数', '页数'),
+    'price': ('price', '价格'),
+    'real_price': ('real_price', '售价'),
+    'category': ('category', '种类', '分类'),
+    'shelf': ('shelf', '书架', '书架号'),
+    'shelf_floor': ('shelf_floor', '书架层数', '层'),
+    'series': ('series', '系列'),
+    'series_number': ('series_number', '系列数'),
+}
+REQUIRED = ('name', 'author', 'press', 'ISBN')
+INTEGERS = ('total_page', 'shelf_floor', 'series_number')
+DECIMALS = ('price', 'real_price')
+# 已有图书按 ISBN 更新时修改的字段（书架位置按册管理，不随导入修改）
+UPDATE_FIELDS = ('name', 'version', 'author', 'trans', 'press', 'total_page', 'price', 'real_price',
+                 'category', 'series', 'series_number')
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def read_xlsx(path):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell or '').strip() for cell in next(rows, ())]
+        for row in rows:
+            yield {key: '' if value is None else str(value) for key, value in zip(header, row)}
+    finally:
+        workbook.close()
+
+
+def read_marc(path):
+    from pymarc import MARCReader
+
+    def subfield(record, tags, code):
+        for field in record.get_fields(*tags):
+            values = field.get_subfields(code)
+            if values:
+                return values[0].strip(' /:;,.')
+        return ''
+
+    with open(path, 'rb') as f:
+        for record in MARCReader(f, to_unicode=True, force_utf8=True):
+            if record is None:
+                yield {}
+                continue
+            pages = re.search(r'\d+', subfield(record, ('300',), 'a'))
+            yield {
+                'name': subfield(record, ('245',), 'a'),
+                'author': subfield(record, ('100', '110', '700'), 'a'),
+                'press': subfield(record, ('260', '264'), 'b'),
+                'isbn': subfield(record, ('020',), 'a').split(' ')[0],
+                'total_page': pages.group() if pages else '',
+            }
+
+
+READERS = {
+    'csv': read_csv,
+    'xlsx': read_xlsx,
+    'marc': read_marc,
+}
+
+
+def guess_format(path):
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    return {'mrc': 'marc', 'iso': 'marc'}.get(ext, ext)
+
+
+def storage():
+    """上传的导入文件及其错误报告、检查点，放在 MEDIA_ROOT 之外，不能通过 /media/ 下载"""
+    return FileSystemStorage(location=getattr(settings, 'IMPORT_ROOT', os.path.join(settings.BASE_DIR, 'imports')))
+
+
+class BookImporter:
+    """图书导入"""
+
+    def __init__(self, path, fmt=None, batch_size=1000, error_path=None, checkpoint_path=None):
+        self.path = path
+        self.format = fmt or guess_format(path)
+        if self.format not in READERS:
+            raise ValueError('不支持的文件格式: %s' % self.format)
+        self.batch_size = batch_size
+        self.error_path = error_path or path + '.errors.csv'
+        self.checkpoint_path = checkpoint_path or path + '.checkpoint'
+        # 种类按名称、书架按编号对照
+        self.categories = {category.name: category.pk for category in refcache.objects(models.Category)}
+        self.shelves = {shelf.code: shelf.pk for shelf in refcache.objects(models.Shelf)}
+        self.created = self.updated = self.failed = 0
+
+    def clean(self, raw):
+        """把文件中的一行转为图书字段"""
+        lowered = {str(key).strip().lower(): str(value or '').strip() for key, value in raw.items()}
+        row = {}
+        for field, names in COLUMNS.items():
+            for name in names:
+                if lowered.get(name.lower()):
+                    row[field] = lowered[name.lower()]
+                    break
+
+        missing = [field for field in REQUIRED if not row.get(field)]
+        if missing:
+            raise RowError('缺少必填字段: %s' % ', '.join(missing))
+        row['ISBN'] = models.clean_isbn(row['ISBN'])
+        for field, value in row.items():
+            max_length = getattr(models.Book._meta.get_field(field), 'max_length', None)
+            if max_length and field not in ('category', 'shelf') and len(value) > max_length:
+                raise RowError('%s 超过 %d 个字符' % (field, max_length))
+        try:
+            for field in INTEGERS:
+                if field in row:
+                    row[field] = int(float(row[field]))
+            for field in DECIMALS:
+                if field in row:
+                    row[field] = Decimal(row[field])
+        except (ValueError, InvalidOperation):
+            raise RowError('%s 不是有效的数字' % field)
+
+        if 'category' in row:
+            if row['category'] not in self.categories:
+                raise RowError('种类不存在: %s' % row['category'])
+            row['category_id'] = self.categories[row.pop('category')]
+        if 'shelf' in row:
+            if row['shelf'] not in self.shelves:
+                raise RowError('书架不存在: %s' % row['shelf'])
+            row['shelf_id'] = self.shelves[row.pop('shelf')]
+        return row
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as f:
+            return json.load(f)['row']
+
+    def save_checkpoint(self, row):
+        temp = self.checkpoint_path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'row': row, 'created': self.created, 'updated': self.updated, 'failed': self.failed}, f)
+        os.replace(temp, self.checkpoint_path)
+
+    @transaction.atomic
+    def write(self, rows):
+        """按 ISBN 批量新建、更新一批图书"""
+        # 同一批中重复的 ISBN 以最后一行为准
+        by_isbn = {row['ISBN']: row for row in rows}
+        existing = {}
+        for book in models.Book.all_objects.filter(ISBN__in=list(by_isbn)):
+            existing.setdefault(book.ISBN, []).append(book)
+
+        created = []
+        updated = []
+        for isbn, row in by_isbn.items():
+            if isbn in existing:
+                for book in existing[isbn]:
+                    for field in UPDATE_FIELDS:
+                        attr = field + '_id' if field == 'category' else field
+                        if attr in row:
+                            setattr(book, attr, row[attr])
+                    updated.append(book)
+            else:
+                created.append(models.Book(**row))
+        models.Book.objects.bulk_create(created)
+        models.Book.all_objects.bulk_update(updated, UPDATE_FIELDS)
+        # 批量写入不会触发信号，单独更新检索索引和书架占用
+        search.index_books(models.Book.all_objects.filter(ISBN__in=list(by_isbn)))
+        shelf_ids = {book.shelf_id for book in created if book.shelf_id}
+        if shelf_ids:
+            shelves.reconcile(shelf_ids)
+        transaction.on_commit(lambda: autocomplete.bump(models.Book))
+        self.created += len(created)
+        self.updated += len(updated)
+
+    def run(self, resume=False, progress=None):
+        """执行导入，返回 (新建数, 更新数, 失败数)"""
+        start = self.load_checkpoint() if resume else 0
+        mode = 'a' if resume and start else 'w'
+        with open(self.error_path, mode, encoding='utf-8-sig', newline='') as f:
+            errors = csv.writer(f)
+            if mode == 'w':
+                errors.writerow(['行号', '错误'])
+            batch = []
+            number = 0
+            for number, raw in enumerate(READERS[self.format](self.path), start=1):
+                if number <= start:
+                    continue
+                try:
+                    batch.append(self.clean(raw))
+                except RowError as e:
+                    errors.writerow([number, str(e)])
+                    self.failed += 1
+                if len(batch) >= self.batch_size:
+                    self.write(batch)
+                    batch = []
+                    f.flush()
+                    self.save_checkpoint(number)
+                    if progress:
+                        progress(number)
+            if batch:
+                self.write(batch)
+            if number > start:
+                self.save_checkpoint(number)
+                if progress:
+                    progress(number)
+        return self.created, self.updated, self.failed
+
+
+@jobs.register('import_books', bind=True)
+def run_import(job, path, fmt=None, resume=False):
+    """后台执行导入，进度（已处理行数）记录在任务上"""
+    def progress(row):
+        models.Job.objects.filter(pk=job.pk).update(progress=row)
+
+    created, updated, failed = BookImporter(path, fmt).run(resume=resume, progress=progress)
+    logger.info('导入 %s 完成: 新建 %d，更新 %d，失败 %d', path, created, updated, failed)
@@ -0,0 +1,130 @@
+"""基于数据库的后台任务队列
+
+任务在请求中通过 enqueue() 入队，由 run_jobs 命令在请求之外执行。
+注册时声明 process=True 的任务是纯计算任务，放到进程池中执行，
+这类任务的处理函数不能访问数据库，只接收 JSON 参数；需要写数据库的结果
+由注册时的 done(返回值) 回到 run_jobs 进程中处理。
+
+领取的任务有 JOB_TIMEOUT 秒的租期：worker 被杀掉（部署、OOM）后遗留的执行中任务
+超过租期后重新排队（计入尝试次数），也不再阻止同一个 key 的任务入队。
+"""
+import datetime
+import json
+import logging
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+_handlers = {}
+
+
+def register(kind, process=False, bind=False, done=None):
+    """注册任务处理函数，bind=True 时处理函数的第一个参数是任务本身
+
+    done 在当前进程中以处理函数的返回值调用（用于进程池任务写回数据库）。
+    """
+    def decorator(func):
+        _handlers[kind] = (func, process, bind, done)
+        return func
+    return decorator
+
+
+def job_timeout():
+    return getattr(settings, 'JOB_TIMEOUT', 3600)
+
+
+def lease_expired():
+    """开始时间早于这个时间的执行中任务视为 worker 已退出"""
+    return timezone.now() - datetime.timedelta(seconds=job_timeout())
+
+
+def enqueue(kind, key='', **payload):
+    """任务入队，key 非空时同一个 key 只保留一个未完成的任务"""
+    if key and models.Job.objects.filter(
+            Q(state='PEN') | Q(state='RUN', start_time__gte=lease_expired()), key=key).exists():
+        return None
+    return models.Job.objects.create(kind=kind, key=key, payload=json.dumps(payload))
+
+
+def requeue_stale():
+    """超过租期的执行中任务重新排队，已用完重试次数的标记为失败，返回处理的任务数"""
+    stale = models.Job.objects.filter(state='RUN', start_time__lt=lease_expired())
+    now = timezone.now()
+    error = '执行超过 %d 秒未完成，worker 可能已退出' % job_timeout()
+    return stale.filter(attempts__lt=MAX_ATTEMPTS).update(state='PEN', error=error) + \
+        stale.filter(attempts__gte=MAX_ATTEMPTS).update(state='ERR', error=error, finish_time=now)
+
+
+def claim(limit):
+    """领取最多 limit 个等待中的任务，用条件更新避免多个 worker 重复领取"""
+    requeue_stale()
+    claimed = []
+    pending = models.Job.objects.filter(state='PEN').order_by('id').values_list('id', flat=True)[:limit]
+    for job_id in list(pending):
+        won = models.Job.objects.filter(pk=job_id, state='PEN').update(
+            state='RUN', start_time=timezone.now(), attempts=F('attempts') + 1)
+        if won:
+            claimed.append(models.Job.objects.get(pk=job_id))
+    return claimed
+
+
+def finish(job, error=None):
+    """记录任务结果，失败的任务在重试次数内重新排队"""
+    if error is None:
+        job.state = 'OK'
+        job.error = ''
+    else:
+        job.state = 'PEN' if job.attempts < MAX_ATTEMPTS else 'ERR'
+        job.error = error
+    job.finish_time = timezone.now()
+    job.save(update_fields=['state', 'error', 'finish_time'])
+
+
+def run(limit=20, executor=None):
+    """执行一批任务，返回执行的任务数量
+
+    executor 为进程池，process=True 的任务提交到进程池并发执行，
+    没有进程池时在当前进程中执行。
+    """
+    # 确保各模块的任务处理函数已注册
+    from . import bulk, images, importer  # noqa: F401
+
+    jobs = claim(limit)
+    futures = []
+    for job in jobs:
+        if job.kind not in _handlers:
+            finish(job, '未注册的任务类型: %s' % job.kind)
+            continue
+        func, process, bind, done = _handlers[job.kind]
+        payload = json.loads(job.payload)
+        if process and executor is not None:
+            futures.append((job, done, executor.submit(func, **payload)))
+            continue
+        try:
+            result = func(job, **payload) if bind else func(**payload)
+            if done:
+                done(result)
+        except Exception as e:
+            logger.exception('任务 %r 执行失败', job)
+            finish(job, repr(e))
+        else:
+            finish(job)
+
+    for job, done, future in futures:
+        try:
+            result = future.result()
+            if done:
+                done(result)
+        except Exception as e:
+            logger.error('任务 %r 执行失败: %r', job, e)
+            finish(job, repr(e))
+        else:
+            finish(job)
+    return len(jobs)
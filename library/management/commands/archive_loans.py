@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library import archive
+
+
+class Command(BaseCommand):
+    help = '把归还已久的借阅及其书评、笔记、租阅、转借移到归档表（分批执行，定时任务使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='归还超过多少天的借阅，默认 ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批（一个事务）处理的借阅数量')
+        parser.add_argument('--pause', type=float, default=0, help='每批之间暂停的秒数，减轻对主库和复制的压力')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        scanned = archived = 0
+        for rows, moved in archive.archive(options['days'], options['batch_size']):
+            scanned += rows
+            archived += moved
+            if options['verbosity'] > 1:
+                self.stdout.write('已归档 %d / %d 条借阅' % (archived, scanned))
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            '已归档借阅 %d 条，耗时 %.2f 秒' % (archived, time.perf_counter() - start)))
@@ -0,0 +1,29 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from library import circulation
+
+
+class Command(BaseCommand):
+    help = '为逾期未还的借阅生成逾期费用（可重复执行，定时任务使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批处理的借阅数量')
+        parser.add_argument('--date', help='按这一天计算逾期（YYYY-MM-DD），默认今天')
+
+    def handle(self, *args, **options):
+        today = datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else None
+        start = time.perf_counter()
+        scanned = created = updated = 0
+        for rows, new, changed in circulation.charge_overdue(today, options['chunk_size']):
+            scanned += rows
+            created += new
+            updated += changed
+            if options['verbosity'] > 1:
+                self.stdout.write('已处理 %d 条借阅' % scanned)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            '逾期借阅 %d 条，新建费用 %d 条，更新 %d 条，耗时 %.2f 秒（%.0f 条/秒）' %
+            (scanned, created, updated, elapsed, scanned / elapsed if elapsed else 0)))
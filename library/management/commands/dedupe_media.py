@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from library import images, models
+
+# 需要迁移的上传目录及引用它们的字段
+SOURCES = (
+    ('book', models.Book, 'cover'),
+    ('user', models.UserProfile, 'avatar'),
+)
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def copy_file(path, new_path):
+    """复制到新位置（同一文件系统时用硬链接）"""
+    try:
+        os.link(path, new_path)
+    except OSError:
+        shutil.copy2(path, new_path)
+
+
+class Command(BaseCommand):
+    help = '把已有的封面、头像迁移到内容寻址存储，合并内容相同的文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只统计，不移动文件、不修改数据库')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = merged = saved = 0
+        seen = set()
+
+        for directory, model, field in SOURCES:
+            root = os.path.join(settings.MEDIA_ROOT, directory)
+            for dirpath, dirnames, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    name = os.path.relpath(path, settings.MEDIA_ROOT).replace('\\', '/')
+                    if images.BLOB_NAME.match(os.path.splitext(filename)[0]):
+                        continue
+
+                    digest = file_digest(path)
+                    new_name = models.blob_name(directory, digest, os.path.splitext(filename)[1].lower())
+                    new_path = os.path.join(settings.MEDIA_ROOT, new_name)
+                    exists = new_name in seen or os.path.exists(new_path)
+                    seen.add(new_name)
+                    if exists:
+                        merged += 1
+                        saved += os.path.getsize(path)
+                    else:
+                        moved += 1
+                    if dry_run:
+                        continue
+
+                    if not exists:
+                        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                        copy_file(path, new_path)
+                    # 先让数据库引用新文件，提交后才删除旧文件，中途失败也不会留下指向不存在文件的记录
+                    with transaction.atomic():
+                        model.all_objects.filter(**{field: name}).update(**{field: new_name})
+                        transaction.on_commit(lambda path=path: os.remove(path))
+
+        if not dry_run:
+            self.recount()
+        self.stdout.write(self.style.SUCCESS(
+            '移动 %d 个文件，合并 %d 个重复文件，节省 %.1f KB' % (moved, merged, saved / 1024)))
+
+    @transaction.atomic
+    def recount(self):
+        """按数据库中的实际引用重算引用次数"""
+        refs = {}
+        for directory, model, field in SOURCES:
+            rows = model.all_objects.exclude(**{field: ''}).exclude(**{field: None}) \
+                .values_list(field).annotate(n=Count('pk')).order_by()
+            for name, n in rows:
+                refs[name] = refs.get(name, 0) + n
+
+        models.MediaBlob.objects.exclude(name__in=list(refs)).update(refs=0)
+        for name, n in refs.items():
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if not os.path.exists(path):
+                continue
+            digest = os.path.splitext(os.path.basename(name))[0]
+            models.MediaBlob.objects.update_or_create(
+                name=name, defaults={'digest': digest, 'size': os.path.getsize(path), 'refs': n})
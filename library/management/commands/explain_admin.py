@@ -0,0 +1,108 @@
+import re
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import EmptyResultSet
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.http import QueryDict
+from django.test import RequestFactory
+
+from library import rollups
+
+# 各数据库 EXPLAIN 输出中表示全表扫描、额外排序的特征
+PATTERNS = {
+    'mysql': (
+        ('全表扫描', re.compile(r'"access_type":\s*"ALL"')),
+        ('filesort', re.compile(r'"using_filesort":\s*true')),
+        ('临时表', re.compile(r'"using_temporary_table":\s*true')),
+    ),
+    'sqlite': (
+        ('全表扫描', re.compile(r'\bSCAN (TABLE )?\w+(?! USING)(\s|$)')),
+        ('filesort', re.compile(r'USE TEMP B-TREE FOR ORDER BY')),
+    ),
+    'postgresql': (
+        ('全表扫描', re.compile(r'Seq Scan')),
+        ('filesort', re.compile(r'\bSort\b')),
+    ),
+}
+
+
+def explain(queryset):
+    """执行 EXPLAIN，返回 (输出, 问题列表)"""
+    vendor = connections[router.db_for_read(queryset.model)].vendor
+    plan = queryset.explain(format='json') if vendor == 'mysql' else queryset.explain()
+    issues = [name for name, pattern in PATTERNS.get(vendor, ()) if pattern.search(plan)]
+    return plan, issues
+
+
+class Command(BaseCommand):
+    help = '对后台列表页（含筛选、检索）和报表实际生成的查询执行 EXPLAIN，标出全表扫描和 filesort'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', default='library', help='只检查这个应用的模型，留空检查全部')
+        parser.add_argument('--search', default='test', help='检索时使用的关键字')
+        parser.add_argument('--fail', action='store_true', help='发现问题时以非零状态退出（用于 CI）')
+        parser.add_argument('--verbose-plan', action='store_true', help='输出完整的执行计划')
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        # 不落库的超级用户，拥有全部权限
+        user = User(username='explain', is_superuser=True, is_staff=True, is_active=True)
+        flagged = 0
+
+        for model, model_admin in admin.site._registry.items():
+            if options['app'] and model._meta.app_label != options['app']:
+                continue
+            for label, queryset in self.querysets(factory, user, model_admin, options['search']):
+                flagged += self.report('%s %s' % (model._meta.label, label), queryset, options)
+
+        # 后台首页的报表不属于某个 ModelAdmin
+        if options['app'] in ('', 'library'):
+            for label, queryset in rollups.dashboard_querysets():
+                flagged += self.report('后台首页 %s' % label, queryset, options)
+
+        if flagged and options['fail']:
+            raise CommandError('%d 个查询存在全表扫描或 filesort' % flagged)
+
+    def report(self, name, queryset, options):
+        """EXPLAIN 一个查询并输出结果，有问题时返回 1"""
+        try:
+            plan, issues = explain(queryset)
+        except (EmptyResultSet, IndexError):
+            # 条件恒为假，数据库不会执行这个查询
+            self.stdout.write('%s: 空结果，不执行查询' % name)
+            return 0
+        if issues:
+            self.stdout.write(self.style.WARNING('%s: %s' % (name, '、'.join(issues))))
+        else:
+            self.stdout.write('%s: OK' % name)
+        if options['verbose_plan'] or issues:
+            self.stdout.write('    ' + plan.replace('\n', '\n    '))
+        return 1 if issues else 0
+
+    def request(self, factory, user, params):
+        request = factory.get('/', params)
+        request.user = user
+        return request
+
+    def querysets(self, factory, user, model_admin, search):
+        """后台列表页默认、各筛选项、检索，以及 ModelAdmin.report_querysets() 提供的查询"""
+        variants = [('列表', {})]
+        request = self.request(factory, user, {})
+        changelist = model_admin.get_changelist_instance(request)
+        for spec in changelist.filter_specs:
+            for choice in list(spec.choices(changelist))[1:2]:
+                params = QueryDict(choice['query_string'].lstrip('?')).dict()
+                variants.append(('筛选 %s' % spec.title, params))
+        if model_admin.get_search_fields(request):
+            variants.append(('检索', {'q': search}))
+
+        for label, params in variants:
+            changelist = model_admin.get_changelist_instance(self.request(factory, user, params))
+            yield label, changelist.queryset[:changelist.list_per_page]
+
+        reports = getattr(model_admin, 'report_querysets', None)
+        if reports:
+            for label, queryset in reports(request):
+                yield label, queryset
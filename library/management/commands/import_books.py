@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.importer import BookImporter, READERS
+
+
+class Command(BaseCommand):
+    help = '从 CSV / Excel / MARC 文件批量导入图书（按 ISBN 新建或更新）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='导入文件')
+        parser.add_argument('--format', choices=sorted(READERS), help='文件格式，默认按扩展名判断')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的行数')
+        parser.add_argument('--resume', action='store_true', help='从上次的检查点继续')
+        parser.add_argument('--errors', help='错误报告路径，默认为 <文件>.errors.csv')
+
+    def handle(self, *args, **options):
+        try:
+            importer = BookImporter(options['path'], options['format'], options['batch_size'], options['errors'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        start = time.perf_counter()
+
+        def progress(row):
+            if options['verbosity'] > 1:
+                self.stdout.write('已处理 %d 行' % row)
+
+        created, updated, failed = importer.run(resume=options['resume'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            '新建 %d，更新 %d，失败 %d（见 %s），耗时 %.1f 秒' %
+            (created, updated, failed, importer.error_path, time.perf_counter() - start)))
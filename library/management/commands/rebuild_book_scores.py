@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from library import scores
+
+
+class Command(BaseCommand):
+    help = '根据有效评论批量重建图书评分'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批更新的图书数量')
+
+    def handle(self, *args, **options):
+        updated = scores.rebuild_scores(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('已重建 %d 本图书的评分' % updated))
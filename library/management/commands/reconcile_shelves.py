@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from library import shelves
+
+
+class Command(BaseCommand):
+    help = '用一次分组查询重新统计书架各层的在架数量，修正计数漂移'
+
+    def add_arguments(self, parser):
+        parser.add_argument('shelf', nargs='*', type=int, help='只统计这些书架（ID），默认全部')
+
+    def handle(self, *args, **options):
+        fixed = shelves.reconcile(options['shelf'] or None)
+        self.stdout.write(self.style.SUCCESS('已修正 %d 个书架层的计数' % fixed))
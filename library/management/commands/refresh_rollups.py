@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from library import rollups
+
+
+class Command(BaseCommand):
+    help = '重新汇总有变化的日期的借还统计（后台首页图表），建议定时执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='重新汇总有借阅以来的全部日期')
+
+    def handle(self, *args, **options):
+        count = rollups.rebuild() if options['all'] else rollups.refresh()
+        self.stdout.write(self.style.SUCCESS('已汇总 %d 天' % count))
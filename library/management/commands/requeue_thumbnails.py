@@ -0,0 +1,20 @@
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+
+from library import images, models
+
+
+class Command(BaseCommand):
+    help = '为缺少衍生图的封面和头像重新排队生成任务'
+
+    def handle(self, *args, **options):
+        queued = 0
+        covers = models.Book.all_objects.exclude(cover='').exclude(cover=None) \
+            .values_list('cover', flat=True).distinct().iterator()
+        avatars = models.UserProfile.all_objects.exclude(avatar='').exclude(avatar=None) \
+            .values_list('avatar', flat=True).distinct().iterator()
+        for name in chain(covers, avatars):
+            if not images.derivatives_exist(name) and images.enqueue_derivatives(name):
+                queued += 1
+        self.stdout.write(self.style.SUCCESS('已排队 %d 个衍生图任务' % queued))
@@ -0,0 +1,35 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from library import jobs
+
+
+class Command(BaseCommand):
+    help = '执行后台任务队列（缩略图等计算任务在进程池中执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='进程池大小，0 表示在当前进程执行')
+        parser.add_argument('--batch-size', type=int, default=20, help='每次领取的任务数量')
+        parser.add_argument('--sleep', type=float, default=2.0, help='队列为空时的等待秒数')
+        parser.add_argument('--once', action='store_true', help='清空队列后退出')
+
+    def handle(self, *args, **options):
+        executor = ProcessPoolExecutor(options['processes']) if options['processes'] else None
+        total = 0
+        try:
+            while True:
+                done = jobs.run(options['batch_size'], executor)
+                total += done
+                if done:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.stdout.write(self.style.SUCCESS('共执行 %d 个任务' % total))
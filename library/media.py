@@ -0,0 +1,155 @@
+"""媒体文件服务
+
+替代 django.views.static.serve：支持强 ETag 条件请求、单段 Range 请求，
+内容寻址的文件名带长期不可变缓存头。MEDIA_SERVE_MODE 可以把文件交给
+前端服务器发送：
+
+    'python'      默认，由 FileResponse 流式发送
+    'x-accel'     nginx，返回 X-Accel-Redirect: MEDIA_ACCEL_PREFIX + 路径
+    'x-sendfile'  Apache/lighttpd，返回 X-Sendfile: 文件绝对路径
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+from . import images
+
+# 内容寻址的文件名（或以其为前缀的衍生图名），内容永远不会变
+HASHED_NAME = re.compile(r'^([0-9a-f]{64})(_\w+)?$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=3600'
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.match(os.path.splitext(posixpath.basename(name))[0]))
+
+
+def etag_for(name, path):
+    """强 ETag：内容寻址的文件直接用文件名，其余按内容哈希
+
+    都带上扩展名：同一个衍生图地址按 Accept 返回 PNG 或 WebP，两种格式的 ETag 不能相同。
+    """
+    stem, ext = os.path.splitext(posixpath.basename(name))
+    if HASHED_NAME.match(stem):
+        return quote_etag(stem + ext)
+    return quote_etag(images.source_hash(os.path.relpath(path, settings.MEDIA_ROOT)) + ext)
+
+
+def not_modified(request, etag, mtime):
+    """条件请求判断，If-None-Match 优先于 If-Modified-Since"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and int(mtime) <= since
+
+
+def parse_range(request, etag, size):
+    """解析单段 Range 请求，返回 (start, end)；不需要分段时返回 None，无法满足时返回 False"""
+    header = request.META.get('HTTP_RANGE', '')
+    match = RANGE.match(header.strip())
+    if not match or not size:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def read_range(path, start, end):
+    """按块读取文件的 [start, end] 区间"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve(request, path, document_root=None, immutable=None):
+    """发送 document_root 下的文件"""
+    document_root = document_root or settings.MEDIA_ROOT
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(document_root, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    stat = os.stat(full_path)
+    etag = etag_for(name, full_path)
+    if immutable is None:
+        immutable = is_hashed(name)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE if immutable else REVALIDATE,
+        'Accept-Ranges': 'bytes',
+    }
+
+    if not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'python')
+
+    if mode in ('x-accel', 'x-sendfile'):
+        # 交给前端服务器发送（包括 Range 的处理）
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel':
+            prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + name
+        else:
+            response['X-Sendfile'] = full_path
+    else:
+        byte_range = parse_range(request, etag, stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % stat.st_size
+            return response
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(full_path, start, end), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, stat.st_size)
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+            response['Content-Length'] = stat.st_size
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,106 @@
+"""请求性能统计
+
+按 PERF_SAMPLE_RATE 抽样记录每个请求的 URL 名、耗时、SQL 数量和耗时、
+重复 SQL 数量以及最慢的几条 SQL，写入 library.perf 日志（每行一个 JSON）。
+不依赖 DEBUG=True：SQL 通过 connection.execute_wrapper 采集。
+
+PERF_BUDGETS 按 URL 名配置预算，超出时记录 warning，'*' 为默认预算：
+
+    PERF_BUDGETS = {
+        '*': {'queries': 50, 'ms': 1000},
+        'admin:library_checkout_changelist': {'queries': 10, 'ms': 300},
+    }
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import routers
+
+logger = logging.getLogger('library.perf')
+
+SLOWEST = 3
+
+
+class QueryRecorder:
+    """记录执行过的 SQL 及耗时"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+
+class PerfMiddleware:
+    """请求耗时和 SQL 统计"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= getattr(settings, 'PERF_SAMPLE_RATE', 0.01):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        stats = {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'ms': round(elapsed * 1000, 1),
+            'queries': len(recorder.queries),
+            'sql_ms': round(sum(duration for sql, duration in recorder.queries) * 1000, 1),
+            'duplicates': len(recorder.queries) - len({sql for sql, duration in recorder.queries}),
+            'slowest': [
+                {'sql': sql[:200], 'ms': round(duration * 1000, 1)}
+                for sql, duration in sorted(recorder.queries, key=lambda q: q[1], reverse=True)[:SLOWEST]
+            ],
+        }
+        logger.info(json.dumps(stats, ensure_ascii=False))
+
+        budgets = getattr(settings, 'PERF_BUDGETS', {})
+        budget = budgets.get(stats['view']) or budgets.get('*')
+        if budget:
+            over = [key for key in ('queries', 'ms') if key in budget and stats[key] > budget[key]]
+            if over:
+                logger.warning(json.dumps(dict(stats, over_budget=over, budget=budget), ensure_ascii=False))
+        return response
+
+
+class ReplicaMiddleware:
+    """每个请求独立的读写分离状态（见 library/routers.py）
+
+    请求中写过数据库时设置 cookie，REPLICA_PIN_SECONDS 秒内同一客户端的请求都读主库。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not routers.replica_aliases():
+            return self.get_response(request)
+
+        with routers.scope(pinned=routers.PIN_COOKIE in request.COOKIES):
+            response = self.get_response(request)
+            wrote = routers.wrote()
+        if wrote:
+            response.set_cookie(routers.PIN_COOKIE, '1', max_age=routers.pin_seconds(), httponly=True)
+        return response
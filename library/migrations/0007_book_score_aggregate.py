@@ -0,0 +1,72 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def aggregate_scores(apps, schema_editor):
+    """由已有的有效评论计算图书的评分人数、总分和星级分布（规则与 library.scores.rebuild_scores 相同）"""
+    Book = apps.get_model('library', 'Book')
+    Comment = apps.get_model('library', 'Comment')
+    stats = {}
+    rows = Comment.objects.filter(status=2, checkout__book__isnull=False) \
+        .values('checkout__book_id', 'score').annotate(n=models.Count('id')).order_by()
+    for row in rows:
+        stat = stats.setdefault(row['checkout__book_id'], {'score_count': 0, 'score_sum': 0})
+        star = 'score_%d' % min(5, max(1, int(round(row['score']))))
+        stat[star] = stat.get(star, 0) + row['n']
+        stat['score_count'] += row['n']
+        stat['score_sum'] += row['score'] * row['n']
+    for book_id, stat in stats.items():
+        Book.objects.filter(pk=book_id).update(score=stat['score_sum'] / stat['score_count'], **stat)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_auto_20190924_1740'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='score_1',
+            field=models.IntegerField(default=0, editable=False, verbose_name='一星'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='score_2',
+            field=models.IntegerField(default=0, editable=False, verbose_name='二星'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='score_3',
+            field=models.IntegerField(default=0, editable=False, verbose_name='三星'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='score_4',
+            field=models.IntegerField(default=0, editable=False, verbose_name='四星'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='score_5',
+            field=models.IntegerField(default=0, editable=False, verbose_name='五星'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='score_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='评分人数'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='score_sum',
+            field=models.FloatField(default=0, editable=False, verbose_name='评分总和'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='shelf',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='library.Shelf', verbose_name='书架'),
+        ),
+        migrations.RunPython(aggregate_scores, migrations.RunPython.noop),
+    ]
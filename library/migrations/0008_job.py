@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:56
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_book_score_aggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30, verbose_name='类型')),
+                ('key', models.CharField(db_index=True, default='', max_length=200, verbose_name='去重键')),
+                ('payload', models.TextField(default='{}', verbose_name='参数')),
+                ('state', models.CharField(choices=[('PEN', '等待'), ('RUN', '执行中'), ('OK', '完成'), ('ERR', '失败')], default='PEN', max_length=3, verbose_name='状态')),
+                ('attempts', models.IntegerField(default=0, verbose_name='尝试次数')),
+                ('error', models.TextField(blank=True, default='', verbose_name='错误')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='新建时间')),
+                ('start_time', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finish_time', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+            ],
+            options={
+                'verbose_name': '后台任务',
+                'verbose_name_plural': '后台任务',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['state', 'id'], name='library_job_state_a5bb4b_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True, verbose_name='路径')),
+                ('bytes', models.IntegerField(default=0, verbose_name='大小')),
+                ('last_access', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='最近访问')),
+            ],
+            options={
+                'verbose_name': '衍生图',
+                'verbose_name_plural': '衍生图',
+            },
+        ),
+    ]
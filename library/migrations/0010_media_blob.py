@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_image_derivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='路径')),
+                ('digest', models.CharField(db_index=True, max_length=64, verbose_name='sha256')),
+                ('size', models.IntegerField(default=0, verbose_name='大小')),
+                ('refs', models.IntegerField(default=0, verbose_name='引用次数')),
+            ],
+            options={
+                'verbose_name': '媒体文件',
+                'verbose_name_plural': '媒体文件',
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def clean_isbn(apps, schema_editor):
+    """已有 ISBN 去掉空白和连字符"""
+    Book = apps.get_model('library', 'Book')
+    for pk, isbn in Book.objects.values_list('pk', 'ISBN').iterator():
+        cleaned = ''.join(isbn.split()).replace('-', '').upper()
+        if cleaned != isbn:
+            Book.objects.filter(pk=pk).update(ISBN=cleaned)
+
+
+def index_books(apps, schema_editor):
+    """为已有图书建立检索索引（切分规则与 library.search 相同）"""
+    from library.search import document_terms
+
+    Book = apps.get_model('library', 'Book')
+    BookSearchTerm = apps.get_model('library', 'BookSearchTerm')
+    books = Book.objects.order_by('pk').only('pk', 'name', 'author', 'trans', 'press')
+    terms = []
+    for book in books.iterator(chunk_size=500):
+        terms.extend(BookSearchTerm(book_id=book.pk, term=term, weight=weight)
+                     for term, weight in document_terms(book).items())
+        if len(terms) >= 5000:
+            BookSearchTerm.objects.bulk_create(terms, batch_size=500)
+            terms = []
+    BookSearchTerm.objects.bulk_create(terms, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_media_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='ISBN',
+            field=models.CharField(db_index=True, max_length=20, verbose_name='国际标准图书编号'),
+        ),
+        migrations.CreateModel(
+            name='BookSearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=2, verbose_name='索引词')),
+                ('weight', models.IntegerField(default=1, verbose_name='权重')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='library.Book', verbose_name='书名')),
+            ],
+            options={
+                'verbose_name': '图书索引',
+                'verbose_name_plural': '图书索引',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='booksearchterm',
+            index=models.Index(fields=['term', 'book'], name='library_boo_term_dd7554_idx'),
+        ),
+        migrations.RunPython(clean_isbn, migrations.RunPython.noop),
+        migrations.RunPython(index_books, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_book_search_term'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='mobile',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=11, verbose_name='电话号'),
+        ),
+    ]
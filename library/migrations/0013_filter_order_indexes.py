@@ -0,0 +1,61 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_userprofile_mobile_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['status', 'score'], name='library_boo_status_693f57_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category', 'status', 'score'], name='library_boo_categor_96ddf6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['status', 'order_number'], name='library_cat_status_673e84_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['type'], name='library_che_type_f8f051_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['return_date'], name='library_che_return__8b2378_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['returned_time', 'return_date'], name='library_che_returne_3fdde9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['status'], name='library_com_status_8f4deb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['status'], name='library_not_status_841e2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rent',
+            index=models.Index(fields=['pay_status'], name='library_ren_pay_sta_49405d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shelf',
+            index=models.Index(fields=['status'], name='library_she_status_fe6c42_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['shift_status'], name='library_shi_shift_s_76d9ac_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['status'], name='library_use_status_8c36fd_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_filter_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='progress',
+            field=models.IntegerField(default=0, verbose_name='进度'),
+        ),
+    ]
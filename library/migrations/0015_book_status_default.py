@@ -0,0 +1,39 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+# 旧默认值保存的是显示文字，改为对应的键
+LABELS = {
+    '在架': 'ON',
+    '借出': 'OUT',
+    '归还': 'RE',
+    '丢失': 'LO',
+}
+
+
+def status_keys(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    for label, key in LABELS.items():
+        Book.objects.filter(book_status=label).update(book_status=key)
+
+
+def status_labels(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    Book.objects.filter(book_status='ON').update(book_status='在架')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_job_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='book_status',
+            field=models.CharField(choices=[('ON', '在架'), ('OUT', '借出'), ('RE', '归还'), ('LO', '丢失')], default='ON', max_length=10, verbose_name='书的状态'),
+        ),
+        migrations.RunPython(status_keys, status_labels),
+    ]
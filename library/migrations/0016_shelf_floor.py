@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_books(apps, schema_editor):
+    """统计已有图书的书架占用"""
+    Book = apps.get_model('library', 'Book')
+    ShelfFloor = apps.get_model('library', 'ShelfFloor')
+    rows = Book.objects.filter(status=2, book_status='ON', shelf__isnull=False) \
+        .values('shelf_id', 'shelf_floor').annotate(n=models.Count('id')).order_by()
+    ShelfFloor.objects.bulk_create([
+        ShelfFloor(shelf_id=row['shelf_id'], floor=row['shelf_floor'], count=row['n']) for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0015_book_status_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShelfFloor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('floor', models.IntegerField(verbose_name='层')),
+                ('count', models.IntegerField(default=0, verbose_name='在架数量')),
+                ('shelf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='floor_counts', to='library.Shelf', verbose_name='书架')),
+            ],
+            options={
+                'verbose_name': '书架层占用',
+                'verbose_name_plural': '书架层占用',
+                'unique_together': {('shelf', 'floor')},
+            },
+        ),
+        migrations.RunPython(count_books, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0016_shelf_floor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleStatDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='日期')),
+            ],
+            options={
+                'verbose_name': '待汇总日期',
+                'verbose_name_plural': '待汇总日期',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('type', models.CharField(choices=[('SC', 'Scan Code'), ('SH', 'Shift')], max_length=2, verbose_name='借阅类型')),
+                ('loans', models.IntegerField(default=0, verbose_name='借出')),
+                ('returns', models.IntegerField(default=0, verbose_name='归还')),
+                ('overdues', models.IntegerField(default=0, verbose_name='逾期')),
+                ('rent_paying', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='待支付租金')),
+                ('rent_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='已支付租金')),
+                ('rent_failed', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='支付失败租金')),
+                ('category', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='library.Category', verbose_name='种类')),
+            ],
+            options={
+                'verbose_name': '每日统计',
+                'verbose_name_plural': '每日统计',
+                'unique_together': {('day', 'category', 'type')},
+            },
+        ),
+    ]
@@ -0,0 +1,146 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:24
+
+from django.db import migrations, models
+import django.db.models.manager
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0017_daily_stat'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='book',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='category',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='checkout',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='comment',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='feedback',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='note',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='rent',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='shelf',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='shift',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='userprofile',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='checkout',
+            name='library_che_return__8b2378_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='checkout',
+            name='library_che_returne_3fdde9_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='library_com_status_8f4deb_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='note',
+            name='library_not_status_841e2f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='shelf',
+            name='library_she_status_fe6c42_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='shift',
+            name='library_shi_shift_s_76d9ac_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='userprofile',
+            name='library_use_status_8c36fd_idx',
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['status', 'book_status', 'shelf'], name='library_boo_status_18e111_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['status', 'time'], name='library_che_status_5ec9ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['status', 'return_date'], name='library_che_status_af7577_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['status', 'returned_time', 'return_date'], name='library_che_status_bbb044_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['status', 'checkout'], name='library_com_status_36be9e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['status', 'create_time'], name='library_fee_status_e723c7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['status', 'checkout'], name='library_not_status_64e741_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rent',
+            index=models.Index(fields=['status', 'create_time'], name='library_ren_status_140bdd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shelf',
+            index=models.Index(fields=['status', 'code'], name='library_she_status_2dbf2b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['status', 'shift_status'], name='library_shi_status_3eb024_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['status', 'end_date'], name='library_use_status_f0a462_idx'),
+        ),
+    ]
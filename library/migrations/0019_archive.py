@@ -0,0 +1,157 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.manager
+import django.utils.timezone
+
+
+ARCHIVE_TABLES = ('library_archivedcheckout', 'library_archivedcomment', 'library_archivednote',
+                  'library_archivedrent', 'library_archivedshift')
+
+
+def compress_tables(apps, schema_editor):
+    """MySQL 上归档表使用压缩行格式"""
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table in ARCHIVE_TABLES:
+        schema_editor.execute('ALTER TABLE %s ROW_FORMAT=COMPRESSED' % schema_editor.quote_name(table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0018_status_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCheckOut',
+            fields=[
+                ('status', models.IntegerField(choices=[(2, '有效'), (-2, '无效')], default=2, verbose_name='状态')),
+                ('create_user_id', models.IntegerField(editable=False, null=True, verbose_name='创建用户')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='新建时间')),
+                ('update_user_id', models.IntegerField(editable=False, null=True, verbose_name='更新用户')),
+                ('update_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='更新时间')),
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_status', models.CharField(choices=[('ON', 'On Shelf'), ('OUT', 'Check Out'), ('RE', 'Returned'), ('LO', 'Lost')], default='ON', max_length=10, verbose_name='书籍状态')),
+                ('time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='借阅时间')),
+                ('type', models.CharField(choices=[('SC', 'Scan Code'), ('SH', 'Shift')], default='SC', max_length=2, verbose_name='Type')),
+                ('return_date', models.DateField(verbose_name='归还日期')),
+                ('returned_time', models.DateTimeField(blank=True, null=True, verbose_name='归还时间')),
+                ('allow_shift', models.BooleanField(default=True, verbose_name='Allow Shift')),
+                ('archive_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='归档时间')),
+                ('book', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='library.Book', verbose_name='书名')),
+                ('user_profile', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='library.UserProfile', verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '借阅归档',
+                'verbose_name_plural': '借阅归档',
+            },
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedShift',
+            fields=[
+                ('status', models.IntegerField(choices=[(2, '有效'), (-2, '无效')], default=2, verbose_name='状态')),
+                ('create_user_id', models.IntegerField(editable=False, null=True, verbose_name='创建用户')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='新建时间')),
+                ('update_user_id', models.IntegerField(editable=False, null=True, verbose_name='更新用户')),
+                ('update_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='更新时间')),
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.TextField(max_length=100, verbose_name='Reason')),
+                ('agreed', models.BooleanField(default=False, verbose_name='Agreed')),
+                ('reply', models.TextField(blank=True, max_length=100, verbose_name='Reply')),
+                ('shift_status', models.CharField(choices=[('Req', 'Requested'), ('Arg', 'Agreed'), ('Com', 'Completed'), ('Abr', 'Abort'), ('Ref', 'Refused')], default='Req', max_length=3, verbose_name='Pay Status')),
+                ('request_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Request Time')),
+                ('reply_time', models.DateTimeField(blank=True, null=True, verbose_name='Reply Time')),
+                ('complete_time', models.DateTimeField(blank=True, null=True, verbose_name='Complete Time')),
+                ('checkout', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='library.ArchivedCheckOut', verbose_name='CheckOut')),
+                ('request_user_profile', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='library.UserProfile', verbose_name='Request User')),
+            ],
+            options={
+                'verbose_name': '转借归档',
+                'verbose_name_plural': '转借归档',
+            },
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedRent',
+            fields=[
+                ('status', models.IntegerField(choices=[(2, '有效'), (-2, '无效')], default=2, verbose_name='状态')),
+                ('create_user_id', models.IntegerField(editable=False, null=True, verbose_name='创建用户')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='新建时间')),
+                ('update_user_id', models.IntegerField(editable=False, null=True, verbose_name='更新用户')),
+                ('update_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='更新时间')),
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('days', models.IntegerField(default=1, verbose_name='Days')),
+                ('amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10, verbose_name='Amount')),
+                ('order_no', models.CharField(blank=True, max_length=50, verbose_name='Order No')),
+                ('trade_no', models.CharField(blank=True, max_length=50, verbose_name='Trade No')),
+                ('pay_status', models.IntegerField(choices=[(-2, 'Failed'), (1, 'Paying'), (2, 'Success')], default=1, verbose_name='Pay Status')),
+                ('checkout', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='library.ArchivedCheckOut', verbose_name='CheckOut')),
+            ],
+            options={
+                'verbose_name': '租阅归档',
+                'verbose_name_plural': '租阅归档',
+            },
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedNote',
+            fields=[
+                ('status', models.IntegerField(choices=[(2, '有效'), (-2, '无效')], default=2, verbose_name='状态')),
+                ('create_user_id', models.IntegerField(editable=False, null=True, verbose_name='创建用户')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='新建时间')),
+                ('update_user_id', models.IntegerField(editable=False, null=True, verbose_name='更新用户')),
+                ('update_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='更新时间')),
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.FloatField(default=1, verbose_name='Page')),
+                ('content', models.TextField(max_length=500, verbose_name='Content')),
+                ('checkout', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='library.ArchivedCheckOut', verbose_name='CheckOut')),
+            ],
+            options={
+                'verbose_name': '笔记归档',
+                'verbose_name_plural': '笔记归档',
+            },
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('status', models.IntegerField(choices=[(2, '有效'), (-2, '无效')], default=2, verbose_name='状态')),
+                ('create_user_id', models.IntegerField(editable=False, null=True, verbose_name='创建用户')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='新建时间')),
+                ('update_user_id', models.IntegerField(editable=False, null=True, verbose_name='更新用户')),
+                ('update_time', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='更新时间')),
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=5.0, verbose_name='Score')),
+                ('content', models.TextField(max_length=500, verbose_name='Content')),
+                ('checkout', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='library.ArchivedCheckOut', verbose_name='借出')),
+            ],
+            options={
+                'verbose_name': '书评归档',
+                'verbose_name_plural': '书评归档',
+            },
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedrent',
+            index=models.Index(fields=['status', 'create_time'], name='library_arc_status_359400_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcheckout',
+            index=models.Index(fields=['status', 'time'], name='library_arc_status_48806f_idx'),
+        ),
+        migrations.RunPython(compress_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:44
+
+import re
+
+from django.db import migrations, models
+
+
+def fill_name_key(apps, schema_editor):
+    """已有用户资料填入姓名检索键（姓 + 名，转小写并去掉空白和标点）"""
+    UserProfile = apps.get_model('library', 'UserProfile')
+    profiles = UserProfile.all_objects.filter(user__isnull=False) \
+        .values_list('pk', 'user__last_name', 'user__first_name')
+    for pk, last_name, first_name in profiles.iterator():
+        key = re.sub(r'[\W_]+', '', last_name + first_name).lower()[:150]
+        if key:
+            UserProfile.all_objects.filter(pk=pk).update(name_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0019_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='name_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=150, verbose_name='姓名检索'),
+        ),
+        migrations.RunPython(fill_name_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0020_profile_name_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stalestatday',
+            name='marked_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='登记时间'),
+        ),
+    ]
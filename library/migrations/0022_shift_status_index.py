@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0021_stale_stat_day_marked_time'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['shift_status'], name='library_shi_shift_s_76d9ac_idx'),
+        ),
+    ]
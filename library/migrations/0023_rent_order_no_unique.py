@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0022_shift_status_index'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='rent',
+            unique_together={('checkout', 'order_no')},
+        ),
+    ]
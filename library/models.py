@@ -1,11 +1,23 @@
+import hashlib
+import os
+import tempfile
+
 from django.contrib.auth.models import User
 from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 # Create your models here.
 
 
+class ValidManager(models.Manager):
+    """只包含有效（status=2）记录的管理器"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(status=2)
+
+
 class Base(models.Model):
     """模型父类"""
     STATUS = (
@@ -18,6 +30,11 @@ class Base(models.Model):
     update_user_id = models.IntegerField('更新用户', null=True, editable=False)
     update_time = models.DateTimeField('更新时间', default=timezone.now, editable=False)
 
+    # 包含无效记录，先声明，作为 _default_manager 供后台、表单校验、关联管理器、dumpdata 等使用
+    all_objects = models.Manager()
+    # 业务代码默认只读取有效记录；需要看到无效记录时（如后台、审计、按主键回写）使用 all_objects
+    objects = ValidManager()
+
     class Meta:
         abstract = True
 
@@ -32,6 +49,7 @@ class Category(Base):
         verbose_name = '种类'
         verbose_name_plural = '种类'
         ordering = ['-status', 'order_number']
+        indexes = [models.Index(fields=['status', 'order_number'])]
 
     def __repr__(self):
         return '<Category {id: %s, name: %s}>' % (self.id, self.name)
@@ -52,6 +70,7 @@ class Shelf(Base):
     class Meta:
         verbose_name ='书架'
         verbose_name_plural = '书架'
+        indexes = [models.Index(fields=['status', 'code'])]
 
     def __repr__(self):
         return '<Shelf {id: %s, code: %s, location: %s}>' % (self.id, self.code, self.location)
@@ -60,17 +79,82 @@ class Shelf(Base):
         return self.code
 
 
-class BookImageStorage(FileSystemStorage):
-    """处理图书封面图片"""
+class ContentAddressedStorage(FileSystemStorage):
+    """按内容哈希保存文件
+
+    上传时边写临时文件边计算 sha256，保存为 <目录>/ab/cd/<哈希><扩展名>，
+    相同内容只保存一份，并在 MediaBlob 中记录引用次数。
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # 文件名由内容决定，不需要追加随机后缀
+        return name
 
     def _save(self, name, content):
-        filename = super()._save(name, content)
-        path = self.path(name)
-        from PIL import Image
-        img = Image.open(path)
-        img.thumbnail([240, 240])
-        img.save(path)
-        return filename
+        directory, basename = os.path.split(name)
+        ext = os.path.splitext(basename)[1].lower()
+        temp_dir = self.path('tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+
+        sha = hashlib.sha256()
+        size = 0
+        fd, temp = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    sha.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            name = blob_name(directory, digest, ext)
+            full_path = self.path(name)
+            # 持有 MediaBlob 行锁时检查、写入文件，避免与释放最后一次引用的删除交错
+            with transaction.atomic():
+                MediaBlob.acquire(name, digest, size)
+                created = not os.path.exists(full_path)
+                if created:
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    os.replace(temp, full_path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(full_path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+        if created:
+            self.blob_created(name)
+        return name
+
+    def blob_created(self, name):
+        """新内容第一次保存后的处理"""
+
+    def delete(self, name):
+        """释放一次引用，没有引用时才删除文件"""
+        if not name:
+            return
+        with transaction.atomic():
+            if MediaBlob.release(name):
+                super().delete(name)
+
+
+def blob_name(directory, digest, ext):
+    """内容寻址的文件名"""
+    return '%s/%s/%s/%s%s' % (directory, digest[:2], digest[2:4], digest, ext)
+
+
+class BookImageStorage(ContentAddressedStorage):
+    """处理图书封面图片（原图立即保存，缩略图由后台任务生成）"""
+
+    def blob_created(self, name):
+        from . import images
+        images.enqueue_derivatives(name)
+
+
+def clean_isbn(isbn):
+    """ISBN 去掉空白和连字符，统一大写，便于精确查找"""
+    return ''.join(str(isbn or '').split()).replace('-', '').upper()
 
 
 class Book(Base):
@@ -88,16 +172,24 @@ class Book(Base):
     author = models.CharField('作者', max_length=20, null=False)
     trans = models.CharField('翻译者', max_length=50, default='', blank=True)
     press = models.CharField('出版社', max_length=20, null=False)
-    ISBN = models.CharField('国际标准图书编号', max_length=20, null=False)
+    ISBN = models.CharField('国际标准图书编号', max_length=20, null=False, db_index=True)
     total_page = models.IntegerField('总页数', default=200)
     price = models.DecimalField('价格', default=50.00, max_digits=10, decimal_places=2)
     real_price = models.DecimalField('售价', default=40.00, max_digits=10, decimal_places=2)
     cover = models.ImageField('封面', blank=True, upload_to='book', storage=BookImageStorage(), null=True)
     score = models.FloatField('评分', default=4.0, editable=False)
+    # 评分聚合，由评论增量维护（见 library/scores.py）
+    score_count = models.IntegerField('评分人数', default=0, editable=False)
+    score_sum = models.FloatField('评分总和', default=0, editable=False)
+    score_1 = models.IntegerField('一星', default=0, editable=False)
+    score_2 = models.IntegerField('二星', default=0, editable=False)
+    score_3 = models.IntegerField('三星', default=0, editable=False)
+    score_4 = models.IntegerField('四星', default=0, editable=False)
+    score_5 = models.IntegerField('五星', default=0, editable=False)
     category = models.ForeignKey(Category, verbose_name=' 种类', on_delete=models.DO_NOTHING, null=True)
     shelf = models.ForeignKey(Shelf, verbose_name='书架', on_delete=models.CASCADE, null=True)
     shelf_floor = models.IntegerField('书架层数', default=1)
-    book_status = models.CharField('书的状态', choices=BOOK_STATUS, default='在架', null=False, max_length=10)
+    book_status = models.CharField('书的状态', choices=BOOK_STATUS, default='ON', null=False, max_length=10)
     series = models.CharField('系列', max_length=20, default='', blank=True)
     series_number = models.IntegerField('系列数', default=0)
 
@@ -105,14 +197,50 @@ class Book(Base):
         verbose_name = '书名'
         verbose_name_plural = '书名'
         ordering = ['-status', '-score']
+        indexes = [
+            models.Index(fields=['status', 'score']),
+            models.Index(fields=['category', 'status', 'score']),
+            # 书架占用统计
+            models.Index(fields=['status', 'book_status', 'shelf']),
+        ]
 
     # def __repr__(self):
     #     return '<Book {id: %s, name: %s, author: %s}>' % (self.id, self.name, self.author)
 
+    def save(self, *args, **kwargs):
+        self.ISBN = clean_isbn(self.ISBN)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
 
+class BookSearchTerm(models.Model):
+    """图书检索的倒排索引（见 library/search.py）"""
+
+    term = models.CharField('索引词', max_length=2)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name='书名')
+    weight = models.IntegerField('权重', default=1)
+
+    class Meta:
+        verbose_name = '图书索引'
+        verbose_name_plural = '图书索引'
+        indexes = [models.Index(fields=['term', 'book'])]
+
+
+class ShelfFloor(models.Model):
+    """书架每层在架图书数量，由图书的上架、移动、借还增量维护（见 library/shelves.py）"""
+
+    shelf = models.ForeignKey(Shelf, on_delete=models.CASCADE, related_name='floor_counts', verbose_name='书架')
+    floor = models.IntegerField('层')
+    count = models.IntegerField('在架数量', default=0)
+
+    class Meta:
+        verbose_name = '书架层占用'
+        verbose_name_plural = '书架层占用'
+        unique_together = ('shelf', 'floor')
+
+
 def calc_end_date(*args, **kwargs):
     """计算失效期"""
 
@@ -121,26 +249,12 @@ def calc_end_date(*args, **kwargs):
     return now + m6
 
 
-class UserStorage(FileSystemStorage):
-    """处理用户头像"""
-    def _save(self, name, content):
-        filename = super()._save(name, content)
+class UserStorage(ContentAddressedStorage):
+    """处理用户头像（原图立即保存，裁剪后的头像由后台任务生成）"""
 
-        path = self.path(name)
-        from PIL import Image
-        img = Image.open(path)
-
-        left = top = right = bottom = 0
-        if img.width > img.height:
-            left = (img.width - img.height)/2
-            right = left + img.height
-            bottom = img.height
-        else:
-            top = (img.height - img.width) / 2
-            bottom = top + img.width
-            right = img.width
-        img.crop((left, top, right, bottom)).resize((200, 200), resample=Image.BICUBIC).save(path)
-        return filename
+    def blob_created(self, name):
+        from . import images
+        images.enqueue_derivatives(name)
 
 
 class UserProfile(Base):
@@ -151,7 +265,7 @@ class UserProfile(Base):
     )
 
     user = models.OneToOneField(User, on_delete=models.DO_NOTHING, null=True, verbose_name='用户')
-    mobile = models.CharField('电话号', max_length=11, default='', blank=True)
+    mobile = models.CharField('电话号', max_length=11, default='', blank=True, db_index=True)
     sex = models.CharField('性别', choices=SEX, max_length=1, default='M', null=False)
     birth = models.DateField('出生日期', null=True, blank=True)
     avatar = models.ImageField('头像', upload_to='user', blank=True, storage=UserStorage(), null=True)
@@ -159,10 +273,13 @@ class UserProfile(Base):
     start_date = models.DateField('开始日期', default=timezone.now)
     end_date = models.DateField('结束日期', default=calc_end_date)
     wx_id = models.CharField('微信号', max_length=100, default='', editable=False)
+    # 姓 + 名转小写、去掉空白和标点，由信号维护，按姓名前缀检索（见 library/search.py）
+    name_key = models.CharField('姓名检索', max_length=150, default='', editable=False, db_index=True)
 
     class Meta:
         verbose_name = '用户配置文件'
         verbose_name_plural = '用户配置文件'
+        indexes = [models.Index(fields=['status', 'end_date'])]
 
     def __repr__(self):
         return '<UserProfile {id: %s, mobile: %s}>' % (self.id, self.mobile)
@@ -205,10 +322,19 @@ class CheckOut(Base):
     class Meta:
         verbose_name = '借阅'
         verbose_name_plural = '借阅'
+        indexes = [
+            models.Index(fields=['type']),
+            # 按天统计借出、逾期
+            models.Index(fields=['status', 'time']),
+            models.Index(fields=['status', 'return_date']),
+            # 未归还且已到期的借阅，按天统计归还
+            models.Index(fields=['status', 'returned_time', 'return_date']),
+        ]
 
     def __repr__(self):
         return '<CheckOut {id: %s, book: %s, user: %s}>' % \
-               (self.id, self.book.name if self.book else '#', self.user.username if self.user else '#')
+               (self.id, self.book.name if self.book else '#',
+                self.user_profile.user.username if self.user_profile and self.user_profile.user else '#')
 
     def __str__(self):
         return '%s -> %s' % (self.book.name, self.user_profile.user.username) if \
@@ -223,6 +349,7 @@ class Comment(Base):
     class Meta:
         verbose_name = _('评论')
         verbose_name_plural = _('评论')
+        indexes = [models.Index(fields=['status', 'checkout'])]
 
     def __str__(self):
         return str(self.score)
@@ -238,6 +365,7 @@ class Note(Base):
     class Meta:
         verbose_name = _('Note')
         verbose_name_plural = _('Note')
+        indexes = [models.Index(fields=['status', 'checkout'])]
 
     def __repr__(self):
         return '<Note {id: %s, page: %s}>' % (self.id, self.page)
@@ -267,6 +395,13 @@ class Rent(Base):
     class Meta:
         verbose_name = _('Rent')
         verbose_name_plural = _('Rent')
+        # 逾期费用的订单号由借阅决定（见 circulation.overdue_order_no），同一借阅只收一次
+        unique_together = ('checkout', 'order_no')
+        indexes = [
+            models.Index(fields=['pay_status']),
+            # 按天统计租金
+            models.Index(fields=['status', 'create_time']),
+        ]
 
     def __repr__(self):
         return '<Rent {id: %s, amount: %s}>' % (self.id, self.amount)
@@ -302,6 +437,8 @@ class Shift(Base):
     class Meta:
         verbose_name = _('Shift')
         verbose_name_plural = _('Shift')
+        # 后台和归档按 shift_status 筛选时不带 status 条件，单独保留 shift_status 索引
+        indexes = [models.Index(fields=['shift_status']), models.Index(fields=['status', 'shift_status'])]
 
     def __repr__(self):
         return '<Shift {id: %s}>' % (self.id,)
@@ -325,9 +462,226 @@ class Feedback(Base):
     class Meta:
         verbose_name = _('Feedback')
         verbose_name_plural = _('Feedback')
+        indexes = [models.Index(fields=['status', 'create_time'])]
 
     def __repr__(self):
         return '<Feedback {id: %s, content: %s}>' % (self.id, self.content)
 
     def __str__(self):
         return self.content if len(self.content) < 35 else self.content[:35] + '..'
+
+
+class Job(models.Model):
+    """后台任务队列"""
+
+    STATE = (
+        ('PEN', '等待'),
+        ('RUN', '执行中'),
+        ('OK', '完成'),
+        ('ERR', '失败'),
+    )
+
+    kind = models.CharField('类型', max_length=30)
+    key = models.CharField('去重键', max_length=200, default='', db_index=True)
+    payload = models.TextField('参数', default='{}')
+    state = models.CharField('状态', choices=STATE, default='PEN', max_length=3)
+    attempts = models.IntegerField('尝试次数', default=0)
+    progress = models.IntegerField('进度', default=0)
+    error = models.TextField('错误', blank=True, default='')
+    create_time = models.DateTimeField('新建时间', default=timezone.now)
+    start_time = models.DateTimeField('开始时间', null=True, blank=True)
+    finish_time = models.DateTimeField('完成时间', null=True, blank=True)
+
+    class Meta:
+        verbose_name = '后台任务'
+        verbose_name_plural = '后台任务'
+        indexes = [models.Index(fields=['state', 'id'])]
+
+    def __repr__(self):
+        return '<Job {id: %s, kind: %s, state: %s}>' % (self.id, self.kind, self.state)
+
+    def __str__(self):
+        return '%s#%s' % (self.kind, self.id)
+
+
+class ImageDerivative(models.Model):
+    """衍生图缓存登记，用于按最近访问时间淘汰"""
+
+    key = models.CharField('路径', max_length=200, unique=True)
+    bytes = models.IntegerField('大小', default=0)
+    last_access = models.DateTimeField('最近访问', default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = '衍生图'
+        verbose_name_plural = '衍生图'
+
+    def __str__(self):
+        return self.key
+
+
+class MediaBlob(models.Model):
+    """内容寻址存储中的文件及其引用次数"""
+
+    name = models.CharField('路径', max_length=200, unique=True)
+    digest = models.CharField('sha256', max_length=64, db_index=True)
+    size = models.IntegerField('大小', default=0)
+    refs = models.IntegerField('引用次数', default=0)
+
+    class Meta:
+        verbose_name = '媒体文件'
+        verbose_name_plural = '媒体文件'
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def acquire(cls, name, digest, size):
+        """增加一次引用（需在事务中调用，行锁持续到事务结束）"""
+        blob, created = cls.objects.select_for_update().get_or_create(
+            name=name, defaults={'digest': digest, 'size': size, 'refs': 1})
+        if not created:
+            cls.objects.filter(pk=blob.pk).update(refs=F('refs') + 1)
+
+    @classmethod
+    def release(cls, name):
+        """减少一次引用，返回文件是否已无引用可以删除（需在事务中调用，删除文件前不要提交）"""
+        blob = cls.objects.select_for_update().filter(name=name).first()
+        if blob is None or blob.refs <= 0:
+            # 不是内容寻址保存的文件（或已无引用），不做处理
+            return False
+        if blob.refs > 1:
+            cls.objects.filter(pk=blob.pk).update(refs=F('refs') - 1)
+            return False
+        blob.delete()
+        return True
+
+
+class DailyStat(models.Model):
+    """按天 × 种类 × 借阅类型汇总的借还统计（见 library/rollups.py）"""
+
+    day = models.DateField('日期')
+    category = models.ForeignKey(Category, null=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                                 verbose_name='种类')
+    type = models.CharField('借阅类型', max_length=2, choices=CheckOut.TYPE)
+    loans = models.IntegerField('借出', default=0)
+    returns = models.IntegerField('归还', default=0)
+    overdues = models.IntegerField('逾期', default=0)
+    rent_paying = models.DecimalField('待支付租金', max_digits=12, decimal_places=2, default=0)
+    rent_paid = models.DecimalField('已支付租金', max_digits=12, decimal_places=2, default=0)
+    rent_failed = models.DecimalField('支付失败租金', max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = '每日统计'
+        verbose_name_plural = '每日统计'
+        unique_together = ('day', 'category', 'type')
+
+
+class StaleStatDay(models.Model):
+    """需要重新汇总的日期"""
+
+    day = models.DateField('日期', unique=True)
+    # 每次登记都会更新，汇总时只删除汇总开始前登记的
+    marked_time = models.DateTimeField('登记时间', default=timezone.now)
+
+    class Meta:
+        verbose_name = '待汇总日期'
+        verbose_name_plural = '待汇总日期'
+
+
+class ArchivedCheckOut(Base):
+    """已归档的借阅（见 library/archive.py），字段与 CheckOut 相同，保留原主键"""
+
+    id = models.IntegerField('ID', primary_key=True)
+    user_profile = models.ForeignKey(UserProfile, null=True, on_delete=models.DO_NOTHING, verbose_name='用户')
+    book = models.ForeignKey(Book, null=True, on_delete=models.DO_NOTHING, verbose_name='书名')
+    book_status = models.CharField('书籍状态', choices=CheckOut.BOOK_STATUS, default='ON', max_length=10)
+    time = models.DateTimeField('借阅时间', default=timezone.now)
+    type = models.CharField(_('Type'), max_length=2, choices=CheckOut.TYPE, default='SC')
+    return_date = models.DateField('归还日期')
+    returned_time = models.DateTimeField('归还时间', null=True, blank=True)
+    allow_shift = models.BooleanField(_('Allow Shift'), default=True)
+    archive_time = models.DateTimeField('归档时间', default=timezone.now)
+
+    class Meta:
+        verbose_name = '借阅归档'
+        verbose_name_plural = '借阅归档'
+        indexes = [models.Index(fields=['status', 'time'])]
+
+    def __str__(self):
+        return '%s -> %s' % (self.book.name, self.user_profile.user.username) if \
+            self.user_profile and self.user_profile.user and self.book else '#->#'
+
+
+class ArchivedComment(Base):
+    """已归档的书评"""
+
+    id = models.IntegerField('ID', primary_key=True)
+    checkout = models.ForeignKey(ArchivedCheckOut, verbose_name='借出', on_delete=models.DO_NOTHING, null=True)
+    score = models.FloatField(_('Score'), default=5.0)
+    content = models.TextField(_('Content'), max_length=500)
+
+    class Meta:
+        verbose_name = '书评归档'
+        verbose_name_plural = '书评归档'
+
+    def __str__(self):
+        return str(self.score)
+
+
+class ArchivedNote(Base):
+    """已归档的笔记"""
+
+    id = models.IntegerField('ID', primary_key=True)
+    checkout = models.ForeignKey(ArchivedCheckOut, verbose_name=_('CheckOut'), on_delete=models.DO_NOTHING, null=True)
+    page = models.FloatField(_('Page'), default=1)
+    content = models.TextField(_('Content'), max_length=500)
+
+    class Meta:
+        verbose_name = '笔记归档'
+        verbose_name_plural = '笔记归档'
+
+    def __str__(self):
+        return '%s' % self.page
+
+
+class ArchivedRent(Base):
+    """已归档的租阅"""
+
+    id = models.IntegerField('ID', primary_key=True)
+    checkout = models.ForeignKey(ArchivedCheckOut, verbose_name=_('CheckOut'), on_delete=models.DO_NOTHING, null=True)
+    days = models.IntegerField(_('Days'), default=1)
+    amount = models.DecimalField(_('Amount'), max_digits=10, decimal_places=2, default=0.0)
+    order_no = models.CharField(_('Order No'), max_length=50, blank=True)
+    trade_no = models.CharField(_('Trade No'), max_length=50, blank=True)
+    pay_status = models.IntegerField(_('Pay Status'), choices=Rent.PAY_STATUS, default=1)
+
+    class Meta:
+        verbose_name = '租阅归档'
+        verbose_name_plural = '租阅归档'
+        indexes = [models.Index(fields=['status', 'create_time'])]
+
+    def __str__(self):
+        return str(self.amount)
+
+
+class ArchivedShift(Base):
+    """已归档的转借"""
+
+    id = models.IntegerField('ID', primary_key=True)
+    checkout = models.ForeignKey(ArchivedCheckOut, verbose_name=_('CheckOut'), on_delete=models.DO_NOTHING, null=True)
+    request_user_profile = models.ForeignKey(UserProfile, verbose_name=_('Request User'),
+                                             on_delete=models.DO_NOTHING, null=True, related_name='+')
+    reason = models.TextField(_('Reason'), max_length=100)
+    agreed = models.BooleanField(_('Agreed'), default=False)
+    reply = models.TextField(_('Reply'), max_length=100, blank=True)
+    shift_status = models.CharField(_('Pay Status'), choices=Shift.SHIFT_STATUS, default='Req', max_length=3)
+    request_time = models.DateTimeField(_('Request Time'), default=timezone.now)
+    reply_time = models.DateTimeField(_('Reply Time'), null=True, blank=True)
+    complete_time = models.DateTimeField(_('Complete Time'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = '转借归档'
+        verbose_name_plural = '转借归档'
+
+    def __str__(self):
+        return self.get_shift_status_display()
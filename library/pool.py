@@ -0,0 +1,178 @@
+"""数据库连接池
+
+Django 2.2 没有连接池，CONN_MAX_AGE 也只是每个线程各保留一个连接。
+library.backends.mysql 引擎在 Django 打开、关闭连接时从连接池借出、归还，
+请求结束时连接回到池中，下一个请求（任意线程）直接使用，不再重新握手和认证。
+
+在 DATABASES 的连接配置中用 POOL 设置（缺省值见 DEFAULTS）：
+
+    'POOL': {
+        'SIZE': 10,         # 每个进程最多的连接数（借出 + 空闲）
+        'TIMEOUT': 5,       # 连接都已借出时最多等待的秒数，超时抛出 PoolTimeout
+        'RECYCLE': 3600,    # 连接使用超过这么多秒后关闭重建（应小于 MySQL 的 wait_timeout）
+        'PRE_PING': True,   # 借出前 ping 一次，断开的连接丢弃重建
+    }
+
+stats() 返回本进程各连接池的指标，可以通过 library:api_db_pool 接口采集；
+每个 worker 进程各有自己的连接池，接口只返回处理该请求的进程的指标。
+"""
+import threading
+import time
+from collections import deque
+
+DEFAULTS = {
+    'SIZE': 10,
+    'TIMEOUT': 5,
+    'RECYCLE': 3600,
+    'PRE_PING': True,
+}
+# 计算每秒新建连接数的时间窗口（秒）
+RATE_WINDOW = 60
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """等待空闲连接超时"""
+
+
+class ConnectionPool:
+    """有上限的连接池，借出前检查连接是否可用、是否过期"""
+
+    def __init__(self, connect, ping=None, size=10, timeout=5, recycle=3600):
+        self.connect = connect
+        self.ping = ping
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.in_use = 0
+        self.idle = deque()
+        self.created = {}
+        self.condition = threading.Condition()
+        self.connect_times = deque()
+        self.counters = dict(connects=0, waits=0, wait_seconds=0.0, max_wait_seconds=0.0,
+                             timeouts=0, recycled=0, ping_failures=0)
+
+    def expired(self, conn):
+        return self.recycle is not None and time.monotonic() - self.created.get(id(conn), 0) > self.recycle
+
+    def acquire(self):
+        """借出一个连接，没有空闲连接且已到上限时等待"""
+        start = time.monotonic()
+        conn = None
+        with self.condition:
+            while not self.idle and self.in_use >= self.size:
+                remaining = start + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout('数据库连接池已满（%d 个连接），等待 %s 秒超时' % (self.size, self.timeout))
+                self.condition.wait(remaining)
+            if self.idle:
+                conn = self.idle.pop()
+            self.in_use += 1
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                self.counters['waits'] += 1
+                self.counters['wait_seconds'] += waited
+                self.counters['max_wait_seconds'] = max(self.counters['max_wait_seconds'], waited)
+
+        try:
+            if conn is not None and self.expired(conn):
+                self.discard(conn)
+                conn = None
+                self.count('recycled')
+            if conn is not None and self.ping is not None and not self.alive(conn):
+                self.discard(conn)
+                conn = None
+                self.count('ping_failures')
+            if conn is None:
+                conn = self.connect()
+                self.created[id(conn)] = time.monotonic()
+                self.counted_connect()
+        except BaseException:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        """归还连接，discard 为真或已过期时关闭"""
+        expired = not discard and self.expired(conn)
+        if discard or expired:
+            self.discard(conn)
+            conn = None
+        with self.condition:
+            self.in_use -= 1
+            if expired:
+                self.counters['recycled'] += 1
+            if conn is not None:
+                self.idle.append(conn)
+            self.condition.notify()
+
+    def alive(self, conn):
+        try:
+            self.ping(conn)
+        except Exception:
+            return False
+        return True
+
+    def discard(self, conn):
+        self.created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def count(self, name):
+        with self.condition:
+            self.counters[name] += 1
+
+    def counted_connect(self):
+        now = time.monotonic()
+        with self.condition:
+            self.counters['connects'] += 1
+            self.connect_times.append(now)
+            while self.connect_times and self.connect_times[0] < now - RATE_WINDOW:
+                self.connect_times.popleft()
+
+    def close(self):
+        """关闭全部空闲连接"""
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+        for conn in idle:
+            self.discard(conn)
+
+    def stats(self):
+        now = time.monotonic()
+        with self.condition:
+            recent = sum(1 for t in self.connect_times if t >= now - RATE_WINDOW)
+            return dict(
+                self.counters,
+                size=self.size,
+                in_use=self.in_use,
+                idle=len(self.idle),
+                connects_per_second=round(recent / RATE_WINDOW, 3),
+                wait_seconds=round(self.counters['wait_seconds'], 3),
+                max_wait_seconds=round(self.counters['max_wait_seconds'], 3),
+            )
+
+
+def get(name, settings_dict, connect, ping=None):
+    """连接配置对应的连接池（每个进程每个数据库一个），name 区分不同的数据库"""
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                options = dict(DEFAULTS, **settings_dict.get('POOL', {}))
+                pool = _pools[name] = ConnectionPool(
+                    connect, ping if options['PRE_PING'] else None,
+                    size=options['SIZE'], timeout=options['TIMEOUT'], recycle=options['RECYCLE'])
+    return pool
+
+
+def stats():
+    """{连接池名称: 指标}"""
+    return {name: pool.stats() for name, pool in list(_pools.items())}
@@ -0,0 +1,131 @@
+"""种类、书架等参考数据的缓存
+
+这些表很小且很少修改，但图书表单的下拉框、列表页筛选、导出和导入都要读取。
+整表缓存在进程内存中，同时放在 Django 缓存里供其他进程加载；
+保存、删除时（事务提交后）递增缓存中的版本号，各进程发现版本变化后重新加载。
+进程每隔 REFCACHE_CHECK_SECONDS 秒才读取一次版本号。
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.forms.models import ModelChoiceField, ModelChoiceIterator
+
+from . import models
+
+# 缓存的参考数据表
+MODELS = (models.Category, models.Shelf)
+# 各版本数据在共享缓存中保留的时间
+DATA_TIMEOUT = 24 * 3600
+
+_local = {}
+_lock = threading.Lock()
+
+
+def check_seconds():
+    return getattr(settings, 'REFCACHE_CHECK_SECONDS', 2)
+
+
+def version_key(model):
+    return 'refcache:%s:version' % model._meta.label_lower
+
+
+def current_version(model):
+    key = version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump(model):
+    """参考数据已修改，使所有进程的缓存失效"""
+    _local.pop(model, None)
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.add(version_key(model), 1, None)
+
+
+def entry(model):
+    now = time.monotonic()
+    cached = _local.get(model)
+    if cached is not None and now < cached['checked'] + check_seconds():
+        return cached
+
+    version = current_version(model)
+    if cached is not None and cached['version'] == version:
+        cached['checked'] = now
+        return cached
+
+    with _lock:
+        data_key = 'refcache:%s:%s' % (model._meta.label_lower, version)
+        objs = cache.get(data_key)
+        if objs is None:
+            # 从主库加载，只读库的复制延迟会让新版本缓存旧数据
+            objs = list(model._default_manager.using(DEFAULT_DB_ALIAS))
+            cache.set(data_key, objs, DATA_TIMEOUT)
+        cached = _local[model] = {
+            'version': version,
+            'checked': now,
+            'objects': objs,
+            'by_pk': {obj.pk: obj for obj in objs},
+        }
+    return cached
+
+
+def objects(model):
+    """按默认排序返回全部对象（只读，不要修改返回的对象）"""
+    return entry(model)['objects']
+
+
+def get(model, pk):
+    """按主键读取，不存在时返回 None"""
+    if pk is None:
+        return None
+    return entry(model)['by_pk'].get(pk)
+
+
+def display(model, pk, default=''):
+    obj = get(model, pk)
+    return default if obj is None else str(obj)
+
+
+class CachedChoiceIterator(ModelChoiceIterator):
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in objects(self.queryset.model):
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(objects(self.queryset.model)) + (1 if self.field.empty_label is not None else 0)
+
+
+class CachedModelChoiceField(ModelChoiceField):
+    """从缓存读取选项、校验选择的外键字段"""
+
+    iterator = CachedChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            obj = get(self.queryset.model, int(value))
+        except (TypeError, ValueError):
+            obj = None
+        if obj is None:
+            return super().to_python(value)
+        return obj
+
+
+class CachedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """从缓存读取选项的列表页筛选"""
+
+    def field_choices(self, field, request, model_admin):
+        return [(obj.pk, str(obj)) for obj in objects(field.related_model)]
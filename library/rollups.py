@@ -0,0 +1,186 @@
+"""借还统计汇总
+
+DailyStat 按天 × 种类 × 借阅类型保存借出、归还、逾期数量和各支付状态的租金，
+后台首页只读取汇总表，不在每次打开时对借阅、租阅做分组统计。
+汇总时同时统计归档表（见 library/archive.py），归档不改变统计结果。
+
+借阅、租阅变化时把受影响的日期记入 StaleStatDay，refresh_rollups 命令只重新汇总这些日期。
+每天的登记与该天的 DailyStat 在同一个事务中删除，且只删除汇总开始前登记的，
+汇总期间再有变化的日期留到下次。
+逾期与当前日期有关：借阅新建时就登记到期日，到期日（以及今天）在过去之前一直保留，
+过去之后再汇总一次即为最终结果。
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from . import models, routers
+
+# 后台首页按天合计的字段
+DASHBOARD_FIELDS = ('loans', 'returns', 'overdues', 'rent_paying', 'rent_paid', 'rent_failed')
+RENT_FIELDS = {
+    1: 'rent_paying',
+    2: 'rent_paid',
+    -2: 'rent_failed',
+}
+
+
+def local_day(value):
+    """日期时间所在的本地日期"""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def days_of(obj):
+    """借阅、租阅影响的统计日期"""
+    if isinstance(obj, models.CheckOut):
+        return {local_day(obj.time), local_day(obj.returned_time), local_day(obj.return_date)}
+    return {local_day(obj.create_time)}
+
+
+def mark(days):
+    """登记需要重新汇总的日期"""
+    days = {day for day in days if day is not None}
+    if days:
+        now = timezone.now()
+        models.StaleStatDay.objects.bulk_create([models.StaleStatDay(day=day, marked_time=now) for day in days],
+                                                ignore_conflicts=True)
+        # 已经登记过的日期更新登记时间，正在进行的汇总不会删除它
+        models.StaleStatDay.objects.filter(day__in=days, marked_time__lt=now).update(marked_time=now)
+
+
+def day_range(day):
+    """本地日期对应的时间范围 [start, end)"""
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+    end = timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()))
+    return start, end
+
+
+def summarize(day, today):
+    """汇总一天，返回 {(category_id, type): {字段: 值}}"""
+    start, end = day_range(day)
+    stats = defaultdict(dict)
+
+    # 到期当天之后才归还的，以及已过到期日仍未归还的
+    overdue = Q(returned_time__gte=end)
+    if day < today:
+        overdue |= Q(returned_time=None)
+
+    for checkouts in (models.CheckOut.objects.all(), models.ArchivedCheckOut.objects.all()):
+        for field, queryset in (
+                ('loans', checkouts.filter(time__gte=start, time__lt=end)),
+                ('returns', checkouts.filter(returned_time__gte=start, returned_time__lt=end)),
+                ('overdues', checkouts.filter(overdue, return_date=day)),
+        ):
+            for row in queryset.values('book__category_id', 'type').annotate(n=Count('id')).order_by():
+                key = row['book__category_id'], row['type']
+                stats[key][field] = stats[key].get(field, 0) + row['n']
+
+    for rents in (models.Rent.objects.all(), models.ArchivedRent.objects.all()):
+        rents = rents.filter(create_time__gte=start, create_time__lt=end)
+        for row in rents.values('checkout__book__category_id', 'checkout__type', 'pay_status') \
+                .annotate(amount=Sum('amount')).order_by():
+            field = RENT_FIELDS.get(row['pay_status'])
+            if field:
+                key = row['checkout__book__category_id'], row['checkout__type'] or 'SC'
+                stats[key][field] = stats[key].get(field, Decimal(0)) + row['amount']
+    return stats
+
+
+def refresh(today=None, chunk_size=500):
+    """重新汇总登记的日期（不晚于今天），返回汇总的天数"""
+    today = today or timezone.localdate()
+    count = 0
+    last = None
+    while True:
+        stale = models.StaleStatDay.objects.filter(day__lte=today).order_by('day')
+        if last is not None:
+            stale = stale.filter(day__gt=last)
+        days = list(stale.values_list('day', flat=True)[:chunk_size])
+        if not days:
+            break
+        last = days[-1]
+        for day in days:
+            started = timezone.now()
+            stats = summarize(day, today)
+            with transaction.atomic():
+                models.DailyStat.objects.filter(day=day).delete()
+                models.DailyStat.objects.bulk_create([
+                    models.DailyStat(day=day, category_id=category_id, type=type, **values)
+                    for (category_id, type), values in stats.items()
+                ])
+                # 汇总期间重新登记的保留，下次再处理；今天保留到明天
+                if day < today:
+                    models.StaleStatDay.objects.filter(day=day, marked_time__lt=started).delete()
+        count += len(days)
+    return count
+
+
+def rebuild():
+    """登记有借阅以来的全部日期并重新汇总，返回汇总的天数"""
+    firsts = [model.objects.order_by('time').values_list('time', flat=True).first()
+              for model in (models.CheckOut, models.ArchivedCheckOut)]
+    firsts = [first for first in firsts if first is not None]
+    if not firsts:
+        return 0
+    day, today = local_day(min(firsts)), timezone.localdate()
+    days = []
+    while day <= today:
+        days.append(day)
+        day += datetime.timedelta(days=1)
+    # 未归还借阅的到期日要在过去之后重新汇总逾期
+    days += models.CheckOut.objects.filter(returned_time=None, return_date__gt=today) \
+        .values_list('return_date', flat=True).distinct().order_by()
+    for i in range(0, len(days), 500):
+        mark(days[i:i + 500])
+    return refresh(today)
+
+
+def dashboard(days=30, today=None):
+    """后台首页图表数据：最近 days 天每天的合计，以及按种类的合计"""
+    with routers.replica():
+        return _dashboard(days, today)
+
+
+def dashboard_querysets(days=30, today=None):
+    """后台首页读取的查询：[(名称, 查询集)]，依次为按天合计、按种类合计"""
+    today = today or timezone.localdate()
+    start = today - datetime.timedelta(days=days - 1)
+    stats = models.DailyStat.objects.filter(day__gte=start, day__lte=today)
+    return [
+        ('按天合计', stats.values('day').annotate(*[Sum(field) for field in DASHBOARD_FIELDS]).order_by()),
+        ('按种类合计', stats.values('category__name').annotate(loans=Sum('loans'), revenue=Sum('rent_paid'))
+         .order_by('-loans')),
+    ]
+
+
+def _dashboard(days, today):
+    today = today or timezone.localdate()
+    start = today - datetime.timedelta(days=days - 1)
+    fields = DASHBOARD_FIELDS
+    (_, daily), (_, categories) = dashboard_querysets(days, today)
+
+    daily = {row['day']: row for row in daily}
+    rows = []
+    for i in range(days):
+        day = start + datetime.timedelta(days=i)
+        row = daily.get(day, {})
+        rows.append(dict(day=day, **{field: row.get(field + '__sum') or 0 for field in fields}))
+    peak = max([max(row['loans'], row['returns'], row['overdues']) for row in rows] + [1])
+    for row in rows:
+        for field in ('loans', 'returns', 'overdues'):
+            row[field + '_pct'] = row[field] * 100 // peak
+
+    return {
+        'days': rows,
+        'peak': peak,
+        'categories': list(categories),
+        'totals': {field: sum(row[field] for row in rows) for field in fields},
+    }
@@ -0,0 +1,134 @@
+"""读写分离
+
+DATABASE_REPLICAS 中的只读库用于列表页、导出、后台首页统计等只读的查询，写入总是走 default。
+默认所有查询都走主库，只有显式进入只读库范围（replica() 或 use_replica()）的查询才读只读库，
+以下情况仍读主库：
+
+- 本次请求（或 scope() 范围内）已经在 default 上执行过写语句，之后的读取要看到刚写入的数据；
+- 处在 default 的事务中；
+- 最近 REPLICA_PIN_SECONDS 秒内写过数据库的客户端（只读库有复制延迟，
+  保存后跳转到列表页时要能看到刚保存的数据），由 ReplicaMiddleware 通过 cookie 标记。
+
+    DATABASES = {
+        'default': {...},
+        'replica': {..., 'TEST': {'MIRROR': 'default'}},
+    }
+    DATABASE_REPLICAS = ['replica']
+    DATABASE_ROUTERS = ['library.routers.PrimaryReplicaRouter']
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_primary'
+
+# 是否允许读只读库
+_replica = ContextVar('library_db_replica', default=False)
+# 是否固定读主库
+_pinned = ContextVar('library_db_pinned', default=False)
+# 是否写过数据库
+_wrote = ContextVar('library_db_wrote', default=False)
+# 修改数据的语句
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def pinned():
+    return _pinned.get()
+
+
+def wrote():
+    return _wrote.get()
+
+
+def pin():
+    """之后的读取都走主库"""
+    if not _pinned.get():
+        _pinned.set(True)
+
+
+def record_writes(execute, sql, params, many, context):
+    """default 连接的 execute_wrapper：执行了修改数据的语句时记为写过数据库"""
+    if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+        if not _wrote.get():
+            _wrote.set(True)
+        pin()
+    return execute(sql, params, many, context)
+
+
+def use_replica():
+    """之后的只读查询走只读库（直到所在的 scope() 结束），没有配置只读库时不改变状态"""
+    if replica_aliases() and not _replica.get():
+        _replica.set(True)
+
+
+@contextmanager
+def replica():
+    """范围内的只读查询走只读库"""
+    token = _replica.set(True)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def scope(pinned=False):
+    """一次请求的路由状态，结束后恢复
+
+    范围内 default 连接真正执行写语句后才记为写过数据库（db_for_write 在只打开编辑页时也会调用）。
+    """
+    tokens = [(_replica, _replica.set(False)), (_pinned, _pinned.set(pinned)), (_wrote, _wrote.set(False))]
+    try:
+        with connections[DEFAULT_DB_ALIAS].execute_wrapper(record_writes):
+            yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """写入走主库，只读范围内的读取走只读库"""
+
+    def db_for_read(self, model, **hints):
+        aliases = replica_aliases()
+        if not aliases or not _replica.get() or _pinned.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 只读库是主库的副本，对象可以互相关联
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 只读库通过复制同步表结构
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """后台列表页（含检索）只读，GET 请求走只读库"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method == 'GET':
+            use_replica()
+        return super().changelist_view(request, extra_context)
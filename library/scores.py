@@ -0,0 +1,108 @@
+"""图书评分聚合
+
+Book.score 由有效评论的数量、总分和星级分布增量维护，
+单条评论的增删改只需要常数次查询，不在读取时对评论表做 AVG。
+重建时同时统计已归档的评论（见 library/archive.py）。
+"""
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Value, When
+
+from . import models
+
+DEFAULT_SCORE = 4.0
+STAR_FIELDS = ('score_1', 'score_2', 'score_3', 'score_4', 'score_5')
+
+
+def star_field(score):
+    """评分所属的星级字段"""
+    star = min(5, max(1, int(round(score))))
+    return STAR_FIELDS[star - 1]
+
+
+def average():
+    """由聚合字段计算平均分的表达式，没有评论时回到默认分"""
+    return Case(
+        When(score_count__gt=0,
+             then=ExpressionWrapper(F('score_sum') / F('score_count'), output_field=FloatField())),
+        default=Value(DEFAULT_SCORE),
+        output_field=FloatField(),
+    )
+
+
+def comment_state(comment_id):
+    """读取评论当前在库中的状态: (book_id, score)，不计入评分时返回 None"""
+    row = models.Comment.objects.filter(pk=comment_id) \
+        .values_list('checkout__book_id', 'score').first()
+    if row is None or row[0] is None:
+        return None
+    return row
+
+
+def adjust(old, new):
+    """把评论从旧状态 old 改为新状态 new 时，增量修正图书评分
+
+    old/new 均为 (book_id, score) 或 None。
+    """
+    if old == new:
+        return
+
+    deltas = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        book_id, score = state
+        delta = deltas.setdefault(book_id, {'score_count': 0, 'score_sum': 0})
+        delta['score_count'] += sign
+        delta['score_sum'] += sign * score
+        star = star_field(score)
+        delta[star] = delta.get(star, 0) + sign
+
+    for book_id, delta in deltas.items():
+        changes = {name: F(name) + value for name, value in delta.items() if value}
+        if changes:
+            models.Book.all_objects.filter(pk=book_id).update(**changes)
+        models.Book.all_objects.filter(pk=book_id).update(score=average())
+
+
+def rebuild_scores(book_ids=None, batch_size=500):
+    """用一次分组查询重建图书评分，并分批写回
+
+    book_ids 为空时重建全部图书，返回更新的图书数量。
+    """
+    books = models.Book.all_objects.order_by('pk')
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+
+    stats = {}
+    for model in (models.Comment, models.ArchivedComment):
+        comments = model.objects.filter(checkout__book__isnull=False)
+        if book_ids is not None:
+            comments = comments.filter(checkout__book_id__in=book_ids)
+        rows = comments.values('checkout__book_id', 'score').annotate(n=Count('id')).order_by()
+        for row in rows:
+            stat = stats.setdefault(row['checkout__book_id'], dict.fromkeys(STAR_FIELDS, 0))
+            stat[star_field(row['score'])] += row['n']
+            stat['score_count'] = stat.get('score_count', 0) + row['n']
+            stat['score_sum'] = stat.get('score_sum', 0) + row['score'] * row['n']
+
+    fields = ['score', 'score_count', 'score_sum'] + list(STAR_FIELDS)
+    updated = 0
+    batch = []
+    for book_id in books.values_list('pk', flat=True).iterator():
+        stat = stats.get(book_id) or dict.fromkeys(STAR_FIELDS, 0)
+        count = stat.get('score_count', 0)
+        total = stat.get('score_sum', 0)
+        batch.append(models.Book(
+            pk=book_id,
+            score=total / count if count else DEFAULT_SCORE,
+            score_count=count,
+            score_sum=total,
+            **{name: stat[name] for name in STAR_FIELDS}
+        ))
+        if len(batch) >= batch_size:
+            models.Book.all_objects.bulk_update(batch, fields)
+            updated += len(batch)
+            batch = []
+    if batch:
+        models.Book.all_objects.bulk_update(batch, fields)
+        updated += len(batch)
+    return updated
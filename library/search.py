@@ -0,0 +1,179 @@
+"""图书、借阅、用户检索
+
+用应用内维护的倒排索引代替 name/author/press 上的 LIKE '%…%'：
+书名、作者、译者、出版社去掉空白和标点后切成单字和相邻二字，
+中文另外按拼音首字母切分（需要安装 pypinyin，没有安装时跳过）。
+查询时取查询词的二字组合在索引中全部命中的图书，按命中权重和评分排序；
+形如 ISBN 的查询直接按 ISBN 精确查找。
+
+借阅和用户的检索只用带索引的条件（用户名、姓名、手机号前缀、图书索引）
+先解析出用户资料和图书的 id，再分别按两个外键列的索引查出借阅 id 后合并，
+不在借阅表上做跨表的 icontains，也不用 OR 连接两列（无法使用索引）。
+姓名按 UserProfile.name_key（姓 + 名规范化后的值）前缀匹配。
+"""
+import re
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import models
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # pragma: no cover
+    lazy_pinyin = None
+
+# 各字段命中时的权重
+FIELD_WEIGHTS = (
+    ('name', 4),
+    ('author', 3),
+    ('trans', 2),
+    ('press', 1),
+)
+ISBN_PATTERN = re.compile(r'^[0-9Xx][0-9Xx-]{8,16}$')
+NON_WORD = re.compile(r'[\W_]+')
+CJK = re.compile(r'[一-鿿]')
+MOBILE_PATTERN = re.compile(r'^\d{3,11}$')
+
+
+def normalize(text):
+    """转小写并去掉空白和标点"""
+    return NON_WORD.sub('', str(text or '')).lower()
+
+
+def name_key(user):
+    """用户的姓名检索键：姓 + 名，转小写并去掉空白和标点"""
+    if user is None:
+        return ''
+    return normalize(user.last_name + user.first_name)[:150]
+
+
+def initials(text):
+    """中文转为拼音首字母，其余字符保持不变"""
+    if lazy_pinyin is None or not CJK.search(text):
+        return ''
+    return ''.join(lazy_pinyin(ch, style=Style.FIRST_LETTER)[0] if CJK.match(ch) else ch for ch in text)
+
+
+def grams(text):
+    """单字和相邻二字"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def document_terms(book):
+    """图书的索引词及权重"""
+    terms = {}
+    for field, weight in FIELD_WEIGHTS:
+        text = normalize(getattr(book, field))
+        for term in grams(text):
+            terms[term] = max(terms.get(term, 0), weight)
+        for term in grams(initials(text)):
+            # 拼音首字母命中的权重低于原文
+            terms[term] = max(terms.get(term, 0), max(weight // 2, 1))
+    return terms
+
+
+def query_terms(query):
+    """查询词对应的索引词，索引词全部命中才算匹配"""
+    text = normalize(query)
+    if len(text) <= 1:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def normalize_isbn(query):
+    """形如 ISBN 的查询返回规范化后的 ISBN，否则返回 None"""
+    query = query.strip()
+    if not ISBN_PATTERN.match(query):
+        return None
+    return models.clean_isbn(query)
+
+
+def create_terms(books):
+    models.BookSearchTerm.objects.bulk_create([
+        models.BookSearchTerm(book_id=book.pk, term=term, weight=weight)
+        for book in books
+        for term, weight in document_terms(book).items()
+    ], batch_size=500)
+
+
+def index_books(books):
+    """重建这些图书的索引词"""
+    books = list(books)
+    models.BookSearchTerm.objects.filter(book__in=[book.pk for book in books]).delete()
+    create_terms(books)
+
+
+def rebuild(batch_size=500):
+    """重建全部图书的索引，返回处理的图书数量
+
+    按批替换，每批图书的索引词在一个事务中删除并重新写入，重建期间检索结果始终完整。
+    """
+    fields = ['pk'] + [field for field, weight in FIELD_WEIGHTS]
+    count = 0
+    batch = []
+    for book in models.Book.all_objects.order_by('pk').only(*fields).iterator(chunk_size=batch_size):
+        batch.append(book)
+        if len(batch) >= batch_size:
+            with transaction.atomic():
+                index_books(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        with transaction.atomic():
+            index_books(batch)
+    return count + len(batch)
+
+
+def search(queryset, query):
+    """在 queryset 中检索图书，结果带 search_rank 注解，按相关度和评分排序"""
+    isbn = normalize_isbn(query)
+    if isbn:
+        return queryset.filter(ISBN=isbn) \
+            .annotate(search_rank=Value(0, output_field=IntegerField())).order_by('-score')
+
+    terms = query_terms(query)
+    if not terms:
+        return queryset.none()
+    hits = models.BookSearchTerm.objects.filter(term__in=terms).values('book_id')
+    matched = hits.annotate(n=Count('id')).filter(n__gte=len(terms))
+    rank = hits.filter(book_id=OuterRef('pk')).annotate(rank=Sum('weight')).values('rank')
+    return queryset.filter(pk__in=matched.values('book_id')) \
+        .annotate(search_rank=Coalesce(Subquery(rank, output_field=IntegerField()), 0)) \
+        .order_by('-search_rank', '-score')
+
+
+def search_profiles(query):
+    """按用户名、姓名前缀或手机号前缀检索用户资料，返回 id 列表
+
+    用户名和姓名分别按各自的索引查询后合并，不用 OR 连接（无法使用索引）。
+    """
+    query = query.strip()
+    if not query:
+        return []
+    profiles = models.UserProfile.all_objects.order_by()
+    if MOBILE_PATTERN.match(query):
+        return list(profiles.filter(mobile__istartswith=query).values_list('pk', flat=True))
+
+    users = User.objects.filter(username__istartswith=query).values('pk')
+    pks = set(profiles.filter(user__in=users).values_list('pk', flat=True))
+    # 姓名按“姓 + 名”书写
+    key = normalize(query)
+    if key:
+        pks.update(profiles.filter(name_key__startswith=key).values_list('pk', flat=True))
+    return sorted(pks)
+
+
+def search_checkouts(queryset, query):
+    """按借阅人（用户名、姓名、手机号）或图书（书名、ISBN）检索借阅，保持 queryset 原有的排序"""
+    profile_ids = search_profiles(query)
+    book_ids = list(search(models.Book.all_objects.all(), query).order_by().values_list('pk', flat=True))
+    if not book_ids:
+        return queryset.filter(user_profile_id__in=profile_ids)
+    if not profile_ids:
+        return queryset.filter(book_id__in=book_ids)
+    pks = set(queryset.filter(user_profile_id__in=profile_ids).order_by().values_list('pk', flat=True))
+    pks.update(queryset.filter(book_id__in=book_ids).order_by().values_list('pk', flat=True))
+    return queryset.filter(pk__in=pks)
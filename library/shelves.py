@@ -0,0 +1,74 @@
+"""书架占用计数
+
+ShelfFloor 记录每个书架每层的在架图书数量，图书上架、移动、借出、禁用时
+增量修正，列表页读取计数即可，不需要对图书表做 COUNT。
+批量写入（导入、批量修改状态）之后按书架重新统计，reconcile_shelves 命令修正漂移。
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from . import models
+
+# 占用书架位置的图书状态
+OCCUPYING = ('ON',)
+
+
+def book_state(book_id):
+    """读取图书当前在库中的位置: (shelf_id, floor)，不占用书架时返回 None"""
+    row = models.Book.objects.filter(pk=book_id, book_status__in=OCCUPYING) \
+        .values_list('shelf_id', 'shelf_floor').first()
+    if row is None or row[0] is None:
+        return None
+    return row
+
+
+def change(shelf_id, floor, delta):
+    updated = models.ShelfFloor.objects.filter(shelf_id=shelf_id, floor=floor).update(count=F('count') + delta)
+    if updated or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            models.ShelfFloor.objects.create(shelf_id=shelf_id, floor=floor, count=delta)
+    except IntegrityError:
+        # 并发新建了这一层的计数
+        models.ShelfFloor.objects.filter(shelf_id=shelf_id, floor=floor).update(count=F('count') + delta)
+
+
+def adjust(old, new):
+    """把图书从旧位置 old 改为新位置 new 时，修正占用计数
+
+    old/new 均为 (shelf_id, floor) 或 None。
+    """
+    if old == new:
+        return
+    if old is not None:
+        change(old[0], old[1], -1)
+    if new is not None:
+        change(new[0], new[1], 1)
+
+
+def reconcile(shelf_ids=None):
+    """用一次分组查询重新统计占用计数，返回修正的层数
+
+    shelf_ids 为空时统计全部书架。
+    """
+    books = models.Book.objects.filter(book_status__in=OCCUPYING, shelf__isnull=False)
+    floors = models.ShelfFloor.objects.all()
+    if shelf_ids is not None:
+        books = books.filter(shelf_id__in=shelf_ids)
+        floors = floors.filter(shelf_id__in=shelf_ids)
+
+    actual = {(row['shelf_id'], row['shelf_floor']): row['n']
+              for row in books.values('shelf_id', 'shelf_floor').annotate(n=Count('id')).order_by()}
+    with transaction.atomic():
+        updated = []
+        for floor in floors.select_for_update():
+            count = actual.pop((floor.shelf_id, floor.floor), 0)
+            if floor.count != count:
+                floor.count = count
+                updated.append(floor)
+        created = [models.ShelfFloor(shelf_id=shelf_id, floor=floor, count=count)
+                   for (shelf_id, floor), count in actual.items()]
+        models.ShelfFloor.objects.bulk_update(updated, ['count'])
+        models.ShelfFloor.objects.bulk_create(created)
+    return len(updated) + len(created)
@@ -0,0 +1,164 @@
+"""模型信号处理"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import autocomplete, models, refcache, rollups, scores, search, shelves
+
+
+@receiver(pre_save, sender=models.Comment)
+@receiver(pre_delete, sender=models.Comment)
+def remember_comment_score(sender, instance, **kwargs):
+    """记录评论修改前对评分的贡献"""
+    instance._score_state = scores.comment_state(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=models.Comment)
+def update_book_score(sender, instance, **kwargs):
+    """评论新建、修改、禁用后增量更新图书评分"""
+    scores.adjust(getattr(instance, '_score_state', None), scores.comment_state(instance.pk))
+
+
+@receiver(post_delete, sender=models.Comment)
+def remove_book_score(sender, instance, **kwargs):
+    """评论删除后扣除其评分"""
+    scores.adjust(getattr(instance, '_score_state', None), None)
+
+
+def release_file(storage, name):
+    """事务提交后释放文件引用"""
+    if name:
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(pre_save, sender=models.Book)
+@receiver(pre_save, sender=models.UserProfile)
+def remember_file(sender, instance, **kwargs):
+    """记录修改前的封面、头像文件"""
+    field = 'cover' if sender is models.Book else 'avatar'
+    instance._old_file = sender._base_manager.filter(pk=instance.pk).values_list(field, flat=True).first() \
+        if instance.pk else None
+
+
+@receiver(post_save, sender=models.Book)
+@receiver(post_save, sender=models.UserProfile)
+def release_replaced_file(sender, instance, **kwargs):
+    """封面、头像被替换后释放旧文件的引用"""
+    file = instance.cover if sender is models.Book else instance.avatar
+    old = getattr(instance, '_old_file', None)
+    if old and old != file.name:
+        release_file(file.storage, old)
+
+
+@receiver(post_delete, sender=models.Book)
+@receiver(post_delete, sender=models.UserProfile)
+def release_deleted_file(sender, instance, **kwargs):
+    """删除图书、用户资料后释放文件引用"""
+    file = instance.cover if sender is models.Book else instance.avatar
+    release_file(file.storage, file.name)
+
+
+@receiver(post_save, sender=models.Book)
+def index_book(sender, instance, update_fields=None, **kwargs):
+    """图书保存后更新检索索引"""
+    fields = {field for field, weight in search.FIELD_WEIGHTS}
+    if update_fields is None or fields & set(update_fields):
+        search.index_books([instance])
+
+
+@receiver(pre_save, sender=models.UserProfile)
+def set_name_key(sender, instance, **kwargs):
+    """用户资料保存前更新姓名检索键"""
+    instance.name_key = search.name_key(instance.user) if instance.user_id else ''
+
+
+@receiver(post_save, sender=User)
+def update_name_key(sender, instance, update_fields=None, **kwargs):
+    """用户姓名修改后更新用户资料的姓名检索键"""
+    if update_fields is None or {'first_name', 'last_name'} & set(update_fields):
+        models.UserProfile.all_objects.filter(user=instance).exclude(name_key=search.name_key(instance)) \
+            .update(name_key=search.name_key(instance))
+
+
+@receiver(pre_save, sender=models.Book)
+@receiver(pre_delete, sender=models.Book)
+def remember_shelf(sender, instance, **kwargs):
+    """记录修改前图书占用的书架位置"""
+    instance._shelf_state = shelves.book_state(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=models.Book)
+def update_shelf_count(sender, instance, **kwargs):
+    """图书上架、移动、借还、禁用后修正书架占用计数"""
+    shelves.adjust(getattr(instance, '_shelf_state', None), shelves.book_state(instance.pk))
+
+
+@receiver(post_delete, sender=models.Book)
+def remove_shelf_count(sender, instance, **kwargs):
+    """删除图书后扣除占用"""
+    shelves.adjust(getattr(instance, '_shelf_state', None), None)
+
+
+@receiver(pre_save, sender=models.CheckOut)
+@receiver(pre_save, sender=models.Rent)
+def remember_stat_days(sender, instance, **kwargs):
+    """记录修改前影响的统计日期"""
+    old = sender._base_manager.filter(pk=instance.pk).first() if instance.pk else None
+    instance._stat_days = rollups.days_of(old) if old else set()
+
+
+@receiver(post_save, sender=models.CheckOut)
+@receiver(post_save, sender=models.Rent)
+@receiver(post_delete, sender=models.CheckOut)
+@receiver(post_delete, sender=models.Rent)
+def mark_stat_days(sender, instance, **kwargs):
+    """借阅、租阅变化后登记需要重新汇总的日期"""
+    rollups.mark(getattr(instance, '_stat_days', set()) | rollups.days_of(instance))
+
+
+@receiver(post_save, sender=models.Category)
+@receiver(post_save, sender=models.Shelf)
+@receiver(post_delete, sender=models.Category)
+@receiver(post_delete, sender=models.Shelf)
+def invalidate_reference(sender, **kwargs):
+    """种类、书架修改后（事务提交后）使参考数据缓存失效"""
+    transaction.on_commit(lambda: refcache.bump(sender))
+
+
+@receiver(pre_save, sender=models.Book)
+@receiver(pre_save, sender=models.CheckOut)
+@receiver(pre_save, sender=models.UserProfile)
+@receiver(pre_save, sender=User)
+def remember_autocomplete_fields(sender, instance, update_fields=None, **kwargs):
+    """记录修改前影响自动完成结果的字段值，update_fields 不含这些字段时不查询"""
+    if instance._state.adding:
+        instance._autocomplete_old = None
+        return
+    names = autocomplete.watched_fields(sender)
+    if update_fields is not None:
+        saved = {sender._meta.get_field(name).name for name in update_fields}
+        names &= saved
+    attnames = {name: sender._meta.get_field(name).attname for name in names}
+    old = sender._base_manager.filter(pk=instance.pk).values(*attnames.values()).first() if names else {}
+    instance._autocomplete_old = None if old is None else {name: old[attnames[name]] for name in names}
+
+
+@receiver(post_save, sender=models.Book)
+@receiver(post_save, sender=models.CheckOut)
+@receiver(post_save, sender=models.UserProfile)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=models.Book)
+@receiver(post_delete, sender=models.CheckOut)
+@receiver(post_delete, sender=models.UserProfile)
+@receiver(post_delete, sender=User)
+def invalidate_autocomplete(sender, instance, **kwargs):
+    """新建、删除或修改了相关字段后（事务提交后）使自动完成的缓存结果失效"""
+    old = getattr(instance, '_autocomplete_old', None) if kwargs.get('created') is False else None
+    changed = None
+    if old is not None:
+        changed = {name for name, value in old.items()
+                   if getattr(instance, sender._meta.get_field(name).attname) != value}
+        if not changed:
+            return
+    transaction.on_commit(lambda: autocomplete.bump(sender, changed))
@@ -0,0 +1,11 @@
+from django import template
+
+from library import rollups
+
+register = template.Library()
+
+
+@register.simple_tag
+def dashboard_stats(days=30):
+    """最近 days 天的借还统计，只读取汇总表（见 library/rollups.py）"""
+    return rollups.dashboard(days)
@@ -1,4 +1,553 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, connection, connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, bulk, changelist, circulation, jobs, media, middleware, models, pool, rollups, routers, scores
 
 # Create your tests here.
 
+
+class ChangelistQueryBudgetTest(TestCase):
+    """后台列表页的查询次数不随行数增长"""
+
+    # 会话、用户、计数、列表、筛选等固定开销
+    BUDGET = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, n):
+        for i in range(n):
+            user = User.objects.create_user('reader%d_%d' % (models.CheckOut.objects.count(), i))
+            profile = models.UserProfile.objects.create(user=user, mobile='1380000%04d' % user.pk)
+            book = models.Book.objects.create(name='book%d' % user.pk, author='author', press='press',
+                                              ISBN='978%010d' % user.pk)
+            checkout = models.CheckOut.objects.create(user_profile=profile, book=book)
+            models.Comment.objects.create(checkout=checkout, content='good')
+            models.Note.objects.create(checkout=checkout, content='note')
+            models.Rent.objects.create(checkout=checkout)
+            models.Shift.objects.create(checkout=checkout, request_user_profile=profile, reason='reason')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists(self):
+        names = ['checkout', 'comment', 'note', 'rent', 'shift', 'userprofile', 'book']
+        self.add_rows(2)
+        # 先访问一次，进程内缓存（种类、书架等）的加载不计入
+        for name in names:
+            self.client.get(reverse('admin:library_%s_changelist' % name))
+        few = {name: self.count_queries(reverse('admin:library_%s_changelist' % name)) for name in names}
+        self.add_rows(8)
+        for name in names:
+            with self.subTest(changelist=name):
+                many = self.count_queries(reverse('admin:library_%s_changelist' % name))
+                self.assertEqual(few[name], many)
+                self.assertLessEqual(many, self.BUDGET)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """并发借同一本书时只有一个成功"""
+
+    CLAIMERS = 16
+
+    def claim(self, barrier, book_id, profile_id, results):
+        try:
+            barrier.wait()
+            while True:
+                try:
+                    circulation.checkout_book(book_id, profile_id)
+                except circulation.BookUnavailable:
+                    results.append(False)
+                except OperationalError:
+                    # SQLite 同一时间只允许一个写事务，被锁时重试
+                    continue
+                else:
+                    results.append(True)
+                break
+        finally:
+            connections.close_all()
+
+    def test_parallel_claimers(self):
+        book = models.Book.objects.create(name='book', author='author', press='press', ISBN='9780000000001')
+        profiles = [models.UserProfile.objects.create(user=User.objects.create_user('reader%d' % i))
+                    for i in range(self.CLAIMERS)]
+        barrier = threading.Barrier(self.CLAIMERS)
+        results = []
+        threads = [threading.Thread(target=self.claim, args=(barrier, book.pk, profile.pk, results))
+                   for profile in profiles]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.CLAIMERS)
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(models.CheckOut.objects.filter(book=book).count(), 1)
+        book.refresh_from_db()
+        self.assertEqual(book.book_status, 'OUT')
+        with self.assertRaises(circulation.BookUnavailable):
+            circulation.checkout_book(book.pk, profiles[0].pk)
+
+
+class KeysetChangeListTest(TestCase):
+    """列表页按游标翻页，排序值相同的行既不重复也不遗漏"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        models.Note.objects.bulk_create([models.Note(page=page, content='n') for page in (1, 1, 2, 2, 2, 2, 3)])
+        # o=2 即按 page 排序，再按 -pk；page=2 的行跨过前两页
+        cls.expected = list(models.Note.objects.order_by('page', '-pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:library_note_changelist')
+        patcher = mock.patch.object(admin.site._registry[models.Note], 'list_per_page', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, query):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def walk(self, cl, link):
+        """沿 next_url 或 previous_url 一直翻到头，返回每页的主键"""
+        pages = [[note.pk for note in cl.result_list]]
+        while getattr(cl, link):
+            cl = self.get(getattr(cl, link))
+            pages.append([note.pk for note in cl.result_list])
+        return pages
+
+    def test_forward_and_backward(self):
+        cl = self.get('?o=2')
+        self.assertTrue(cl.keyset)
+        self.assertIsNone(cl.previous_url)
+        pages = self.walk(cl, 'next_url')
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        # 末页是最后 3 行，往前翻回首页
+        last = self.get(cl.last_url)
+        self.assertIsNone(last.next_url)
+        self.assertIsNone(last.last_url)
+        pages = self.walk(last, 'previous_url')
+        self.assertEqual(pages[0], self.expected[-3:])
+        self.assertEqual(sum(reversed(pages), []), self.expected)
+
+    def test_nullable_ordering_uses_page_numbers(self):
+        # o=1 按可为空的外键 checkout 排序
+        cl = self.get('?o=1')
+        self.assertFalse(cl.keyset)
+        self.assertEqual(len(cl.result_list), 3)
+        self.assertEqual(len(self.get('?o=1&p=2').result_list), 1)
+
+    def test_invalid_token(self):
+        outdated = changelist.encode(['1'])
+        for token in ('garbage', outdated):
+            response = self.client.get(self.url + '?o=2&_after=' + token)
+            self.assertRedirects(response, self.url + '?e=1', fetch_redirect_response=False)
+
+    def test_estimated_count(self):
+        notes = models.Note.objects.order_by('pk')
+        with override_settings(ADMIN_EXACT_COUNT_THRESHOLD=5):
+            paginator = changelist.EstimatedCountPaginator(notes, 3)
+            self.assertEqual((paginator.count, paginator.estimated), (6, True))
+            self.assertTrue(self.get('?o=2').count_estimated)
+            paginator = changelist.EstimatedCountPaginator(notes, 3)
+            paginator.exact = True
+            self.assertEqual((paginator.count, paginator.estimated), (7, False))
+        with override_settings(ADMIN_EXACT_COUNT_THRESHOLD=10):
+            paginator = changelist.EstimatedCountPaginator(notes, 3)
+            self.assertEqual((paginator.count, paginator.estimated), (7, False))
+            self.assertFalse(self.get('?o=2').count_estimated)
+
+
+class AdminCheckoutTest(TestCase):
+    """后台新建借阅同样用条件 UPDATE 占用图书，同一本书不能借出两次"""
+
+    def test_second_add_rejected(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        book = models.Book.objects.create(name='book', author='author', press='press', ISBN='9780000000002')
+        url = reverse('admin:library_checkout_add')
+        responses = []
+        for i in range(2):
+            profile = models.UserProfile.objects.create(user=User.objects.create_user('reader%d' % i))
+            responses.append(self.client.post(url, {
+                'user_profile': profile.pk, 'book': book.pk, 'type': 'SC',
+                'time_0': '2020-01-01', 'time_1': '10:00:00', 'return_date': '2020-01-16', 'allow_shift': 'on',
+            }))
+
+        self.assertEqual(responses[0].status_code, 302)
+        self.assertEqual(responses[1].status_code, 200)
+        self.assertIn('book', responses[1].context['adminform'].form.errors)
+        checkouts = models.CheckOut.objects.filter(book=book)
+        self.assertEqual(checkouts.count(), 1)
+        self.assertEqual(checkouts.get().user_profile.user.username, 'reader0')
+        self.assertEqual(checkouts.get().book_status, 'OUT')
+        book.refresh_from_db()
+        self.assertEqual(book.book_status, 'OUT')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    """只读范围内的读取走只读库，执行写语句后固定读主库"""
+
+    def write(self, sql='UPDATE library_book SET name = name'):
+        routers.record_writes(lambda *args: None, sql, None, False, {})
+
+    def test_routing(self):
+        with routers.scope():
+            self.assertEqual(models.Book.objects.all().db, 'default')
+            with routers.replica():
+                self.assertEqual(models.Book.objects.all().db, 'replica')
+                self.assertEqual(router.db_for_write(models.Book), 'default')
+                self.assertEqual(models.Book.objects.all().db, 'replica')
+                self.write('SAVEPOINT s1')
+                self.assertEqual(models.Book.objects.all().db, 'replica')
+                self.write()
+                self.assertEqual(models.Book.objects.all().db, 'default')
+        with routers.scope(), routers.replica():
+            self.assertEqual(models.Book.objects.all().db, 'replica')
+
+    def test_middleware_pins_after_write(self):
+        seen = []
+
+        def view(request):
+            routers.use_replica()
+            seen.append(models.Book.objects.all().db)
+            if request.method == 'POST':
+                self.write()
+                seen.append(models.Book.objects.all().db)
+            return HttpResponse()
+
+        factory = RequestFactory()
+        response = middleware.ReplicaMiddleware(view)(factory.post('/'))
+        self.assertEqual(seen, ['replica', 'default'])
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+        seen.clear()
+        request = factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = '1'
+        middleware.ReplicaMiddleware(view)(request)
+        response = middleware.ReplicaMiddleware(view)(factory.get('/'))
+        self.assertEqual(seen, ['default', 'replica'])
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(models.Book.objects.all().db, 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaAdminTest(TransactionTestCase):
+    """后台请求实际查询的库：列表页读只读库，保存后跳转回来的列表页读主库
+
+    default 处在事务中时读取总是走主库，所以用 TransactionTestCase。
+    """
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        book = models.Book.objects.create(name='book', author='author', press='press', ISBN='9780000000003')
+        profile = models.UserProfile.objects.create(user=User.objects.create_user('reader'))
+        self.checkout = models.CheckOut.objects.create(user_profile=profile, book=book, book_status='OUT')
+
+    def request(self, method, url, data=None):
+        """返回 (响应, 主库上查询借阅表的次数, 只读库上查询借阅表的次数)"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, data)
+
+        def count(queries):
+            return sum('"library_checkout"' in query['sql'] for query in queries)
+        return response, count(primary), count(replica)
+
+    def test_admin_flow(self):
+        changelist = reverse('admin:library_checkout_changelist')
+        change = reverse('admin:library_checkout_change', args=[self.checkout.pk])
+
+        response, primary, replica = self.request('get', changelist)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+        # 只打开编辑页不算写入
+        response, primary, replica = self.request('get', change)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+        response, primary, replica = self.request('post', change, {
+            'user_profile': self.checkout.user_profile_id, 'book': self.checkout.book_id, 'type': 'SC',
+            'book_status': 'OUT', 'time_0': '2020-01-01', 'time_1': '10:00:00', 'return_date': '2020-01-20',
+            'allow_shift': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(replica, 0)
+
+        response, primary, replica = self.request('get', response.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+
+class ArchiveTest(TestCase):
+    """归档已结束的借阅及其书评、笔记、租阅、转借，评分和借还统计不变"""
+
+    def loan(self, book, name, **rent_or_shift):
+        profile = models.UserProfile.objects.create(user=User.objects.create_user(name))
+        returned = timezone.now() - datetime.timedelta(days=10)
+        checkout = models.CheckOut.objects.create(
+            user_profile=profile, book=book, time=returned - datetime.timedelta(days=5),
+            return_date=(returned + datetime.timedelta(days=1)).date(), returned_time=returned)
+        models.Comment.objects.create(checkout=checkout, score=4.0, content='c')
+        models.Note.objects.create(checkout=checkout, content='n')
+        models.Rent.objects.create(checkout=checkout, amount=3, pay_status=rent_or_shift.get('pay_status', 2))
+        models.Shift.objects.create(checkout=checkout, reason='r',
+                                    shift_status=rent_or_shift.get('shift_status', 'Com'))
+        return checkout
+
+    def snapshot(self):
+        scores.rebuild_scores()
+        rollups.rebuild()
+        books = list(models.Book.all_objects.order_by('pk').values('score', 'score_count', 'score_sum'))
+        stats = list(models.DailyStat.objects.order_by('day', 'category_id', 'type')
+                     .values('day', 'category_id', 'type', 'loans', 'returns', 'overdues',
+                             'rent_paying', 'rent_paid', 'rent_failed'))
+        return books, stats
+
+    def test_archive(self):
+        book = models.Book.objects.create(name='book', author='author', press='press', ISBN='9780000000004')
+        done = self.loan(book, 'done')
+        unpaid = self.loan(book, 'unpaid', pay_status=1)
+        shifting = self.loan(book, 'shifting', shift_status='Req')
+        before = self.snapshot()
+        self.assertEqual(before[0][0]['score_count'], 3)
+        self.assertTrue(before[1])
+
+        self.assertEqual(list(archive.archive(days=1)), [(1, 1)])
+
+        self.assertFalse(models.CheckOut.all_objects.filter(pk=done.pk).exists())
+        self.assertTrue(models.ArchivedCheckOut.all_objects.filter(pk=done.pk).exists())
+        for model, archived in archive.DEPENDENTS:
+            self.assertFalse(model.all_objects.filter(checkout=done).exists())
+            self.assertEqual(archived.all_objects.filter(checkout_id=done.pk).count(), 1)
+            self.assertEqual(model.all_objects.filter(checkout__in=[unpaid, shifting]).count(), 2)
+        self.assertEqual(self.snapshot(), before)
+
+
+class FakeConnection:
+    broken = False
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """连接池的等待超时、过期重建、ping 失败和丢弃"""
+
+    def make_pool(self, **kwargs):
+        self.connections = []
+
+        def connect():
+            conn = FakeConnection()
+            self.connections.append(conn)
+            return conn
+
+        def ping(conn):
+            if conn.broken:
+                raise OSError('gone away')
+
+        return pool.ConnectionPool(connect, ping, **kwargs)
+
+    def test_timeout(self):
+        connections = self.make_pool(size=1, timeout=0.05)
+        conn = connections.acquire()
+        with self.assertRaises(pool.PoolTimeout):
+            connections.acquire()
+        self.assertEqual(connections.stats()['timeouts'], 1)
+        self.assertEqual(connections.stats()['in_use'], 1)
+        connections.release(conn)
+        self.assertIs(connections.acquire(), conn)
+
+    def test_recycle(self):
+        clock = [100.0]
+        with mock.patch.object(pool, 'time', SimpleNamespace(monotonic=lambda: clock[0])):
+            connections = self.make_pool(recycle=10)
+            conn = connections.acquire()
+            connections.release(conn)
+            self.assertIs(connections.acquire(), conn)
+            # 借出期间过期，归还时关闭
+            clock[0] += 11
+            connections.release(conn)
+            self.assertTrue(conn.closed)
+            self.assertEqual(connections.stats()['idle'], 0)
+            # 空闲期间过期，借出时重建
+            conn = connections.acquire()
+            connections.release(conn)
+            clock[0] += 11
+            self.assertIsNot(connections.acquire(), conn)
+            self.assertTrue(conn.closed)
+            self.assertEqual(connections.stats()['recycled'], 2)
+            self.assertEqual(connections.stats()['connects'], 3)
+
+    def test_ping_failure(self):
+        connections = self.make_pool()
+        conn = connections.acquire()
+        connections.release(conn)
+        conn.broken = True
+        self.assertIsNot(connections.acquire(), conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(connections.stats()['ping_failures'], 1)
+        self.assertEqual(connections.stats()['in_use'], 1)
+
+    def test_discard(self):
+        connections = self.make_pool(size=1)
+        conn = connections.acquire()
+        connections.release(conn, discard=True)
+        self.assertTrue(conn.closed)
+        self.assertEqual((connections.stats()['in_use'], connections.stats()['idle']), (0, 0))
+        self.assertIsNot(connections.acquire(), conn)
+        self.assertEqual(len(self.connections), 2)
+
+
+class MediaServeTest(SimpleTestCase):
+    """媒体文件的 ETag 条件请求和 Range 请求"""
+
+    digest = 'a' * 64
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(MEDIA_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.names = {}
+        for fmt in ('png', 'webp'):
+            name = 'cache/aa/%s_100.%s' % (self.digest, fmt)
+            os.makedirs(os.path.join(root, 'cache/aa'), exist_ok=True)
+            with open(os.path.join(root, name), 'wb') as f:
+                f.write(fmt.encode() * 10)
+            self.names[fmt] = name
+
+    def get(self, fmt, **headers):
+        return media.serve(RequestFactory().get('/', **headers), self.names[fmt])
+
+    def test_etag_per_format(self):
+        png, webp = self.get('png'), self.get('webp')
+        self.assertNotEqual(png['ETag'], webp['ETag'])
+        self.assertEqual(self.get('webp', HTTP_IF_NONE_MATCH=webp['ETag']).status_code, 304)
+        self.assertEqual(self.get('webp', HTTP_IF_NONE_MATCH=png['ETag']).status_code, 200)
+
+    def test_range(self):
+        response = self.get('png', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/30')
+        self.assertEqual(b''.join(response.streaming_content), b'gpng')
+        response = self.get('png', HTTP_RANGE='bytes=30-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */30')
+
+
+class BookScoreTest(TestCase):
+    """评论增删改后增量维护的评分与全量重建一致"""
+
+    def test_adjust_matches_rebuild(self):
+        book = models.Book.objects.create(name='book', author='author', press='press', ISBN='9780000000005')
+        checkout = models.CheckOut.objects.create(book=book)
+        fields = ('score', 'score_count', 'score_sum') + scores.STAR_FIELDS
+
+        def check():
+            incremental = models.Book.all_objects.filter(pk=book.pk).values(*fields).get()
+            scores.rebuild_scores([book.pk])
+            self.assertEqual(incremental, models.Book.all_objects.filter(pk=book.pk).values(*fields).get())
+
+        first = models.Comment.objects.create(checkout=checkout, score=5.0, content='a')
+        second = models.Comment.objects.create(checkout=checkout, score=2.0, content='b')
+        check()
+        first.score = 3.0
+        first.save()
+        check()
+        second.status = -2
+        second.save()
+        check()
+        first.delete()
+        check()
+        self.assertEqual(models.Book.all_objects.get(pk=book.pk).score_count, 0)
+
+
+class ChargeOverdueTest(TestCase):
+    """重复执行逾期收费不会重复收费"""
+
+    def test_run_twice(self):
+        today = datetime.date(2026, 3, 10)
+        book = models.Book.objects.create(name='book', author='author', press='press', ISBN='9780000000006')
+        late = models.CheckOut.objects.create(book=book, return_date=today - datetime.timedelta(days=4))
+        models.CheckOut.objects.create(book=book, return_date=today + datetime.timedelta(days=1))
+
+        self.assertEqual(list(circulation.charge_overdue(today)), [(1, 1, 0)])
+        self.assertEqual(list(circulation.charge_overdue(today)), [(1, 0, 0)])
+        rent = models.Rent.all_objects.get()
+        self.assertEqual((rent.checkout_id, rent.days, rent.amount), (late.pk, 4, circulation.overdue_fee() * 4))
+
+        # 第二天只更新已有的费用
+        self.assertEqual(list(circulation.charge_overdue(today + datetime.timedelta(days=1))), [(1, 0, 1)])
+        self.assertEqual(models.Rent.all_objects.get().days, 5)
+
+        with self.assertRaises(IntegrityError):
+            models.Rent.objects.create(checkout=late, order_no=circulation.overdue_order_no(late.pk))
+
+
+@override_settings(BULK_BATCH_SIZE=3)
+class BulkStatusTest(TestCase):
+    """按主键区间分批修改状态：跨多批、主键不连续时只修改选中的行"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('staff')
+        notes = [models.Note.objects.create(page=i % 3, content='n') for i in range(20)]
+        # 删除部分行，留下主键空洞
+        models.Note.objects.filter(pk__in=[note.pk for note in notes[5:9]]).delete()
+        self.selected = models.Note.objects.exclude(page=0)
+
+    def assert_updated(self, expected):
+        self.assertGreater(len(expected), bulk.batch_size())
+        self.assertEqual(set(models.Note.all_objects.filter(status=-2).values_list('pk', flat=True)), expected)
+        self.assertFalse(models.Note.all_objects.filter(pk__in=expected).exclude(update_user_id=self.user.pk))
+
+    def test_update_status(self):
+        expected = set(self.selected.values_list('pk', flat=True))
+        self.assertEqual(bulk.update_status(self.selected, -2, self.user.pk), len(expected))
+        self.assert_updated(expected)
+
+    def test_background(self):
+        expected = set(self.selected.values_list('pk', flat=True))
+        job = bulk.enqueue_update_status(self.selected, -2, self.user.pk)
+        # 入队后新建的行不在任务范围内
+        models.Note.objects.create(page=1, content='later')
+        self.assertEqual(jobs.run(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.progress), ('OK', len(expected)))
+        self.assert_updated(expected)
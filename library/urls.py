@@ -23,7 +23,10 @@ urlpatterns = [
     # 后台页面
     path('', views.page_index, name='index'),
     path('re/', views.page_return, name='return'),
+    path('img/<int:size>/<path:name>', views.image, name='image'),
 
     # 后台接口
-
+    path('api/checkout/', views.api_checkout, name='api_checkout'),
+    path('api/return/', views.api_return, name='api_return'),
+    path('api/db-pool/', views.api_db_pool, name='api_db_pool'),
 ]
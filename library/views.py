@@ -1,15 +1,25 @@
+import json
+import os
+
 from django.contrib import admin
-from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required, permission_required
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, redirect
+from django.views.decorators.http import require_GET, require_POST
 
 
 # Create your views here.
 from django.urls import reverse
 
+from . import circulation, images, media, models, pool
+
+# 每次请求最多处理的条码数（一车还书）
+MAX_SCANS = 200
+
 
 def page_index(request):
     """首页（直接跳转到登录页）"""
-    print(1333)
     return redirect(reverse('admin:login'))
 
 
@@ -18,9 +28,66 @@ def page_return(request):
     """还书页面"""
     context = dict(
         admin.site.each_context(request),
-        title='还书1111',
+        title='还书',
     )
-    print('111')
-
     return render(request, 'library/return.html', context)
 
+
+@require_POST
+@permission_required('library.add_checkout', raise_exception=True)
+def api_checkout(request):
+    """借书接口，请求体为 {"book": 图书 ID, "user_profile": 用户资料 ID}"""
+    try:
+        data = json.loads(request.body.decode())
+        book_id, user_profile_id = int(data['book']), int(data['user_profile'])
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('需要 JSON: {"book": ..., "user_profile": ...}')
+    if not models.UserProfile.objects.filter(pk=user_profile_id).exists():
+        return HttpResponseBadRequest('用户不存在')
+    try:
+        checkout = circulation.checkout_book(book_id, user_profile_id, request.user.id)
+    except circulation.BookUnavailable:
+        return JsonResponse({'ok': False, 'message': '图书不在架'}, status=409)
+    return JsonResponse({'ok': True, 'checkout': checkout.pk, 'return_date': checkout.return_date})
+
+
+@require_POST
+@permission_required('library.change_checkout', raise_exception=True)
+def api_return(request):
+    """扫码还书接口，请求体为 {"codes": [条码, ...]}"""
+    try:
+        codes = json.loads(request.body.decode())['codes']
+    except (ValueError, KeyError, TypeError):
+        codes = None
+    if not isinstance(codes, list):
+        return HttpResponseBadRequest('需要 JSON: {"codes": [...]}')
+    codes = [str(code).strip() for code in codes if str(code).strip()]
+    if len(codes) > MAX_SCANS:
+        return HttpResponseBadRequest('一次最多 %d 个条码' % MAX_SCANS)
+    results = circulation.return_books(codes, request.user.id) if codes else []
+    return JsonResponse({'results': results})
+
+
+@require_GET
+@staff_member_required
+def api_db_pool(request):
+    """数据库连接池指标：借出、空闲、等待次数和时间、每秒新建连接数等（计数为进程启动以来的累计值）
+
+    连接池在每个 worker 进程中各有一个，这里只返回处理本次请求的进程的指标（pid 标明是哪个进程），
+    采集时要多次请求并按 pid 汇总，不能当作整个服务的总数。
+    """
+    return JsonResponse({'pid': os.getpid(), 'pools': pool.stats()})
+
+
+@require_GET
+def image(request, size, name):
+    """封面、头像的衍生图（按 Accept 协商 WebP）"""
+    config = images.preset(name)
+    if config is None or size not in config[0] or '..' in name or not os.path.exists(images.source_path(name)):
+        raise Http404
+    fmt = 'webp' if 'image/webp' in request.META.get('HTTP_ACCEPT', '') else images.default_format(name)
+    key = images.get_derivative(name, size, fmt)
+    # 地址不含内容哈希，不能标记为不可变，依靠 ETag 重新验证
+    response = media.serve(request, key, immutable=False)
+    response['Vary'] = 'Accept'
+    return response
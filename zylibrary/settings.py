@@ -41,6 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 放在最前面，统计包括其它中间件在内的耗时和 SQL
+    'library.middleware.PerfMiddleware',
+    'library.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,14 +80,30 @@ WSGI_APPLICATION = 'zylibrary.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # MySQL 引擎加连接池（library.pool），请求结束时连接回到池中复用
+        'ENGINE': 'library.backends.mysql',
         'NAME': 'library',
         'USER': 'root',
         'PASSWORD': '123456',
         'HOST': 'localhost',
         'PORT': '3306',
+        'POOL': {
+            'SIZE': 10,
+            'TIMEOUT': 5,
+            'RECYCLE': 3600,
+            'PRE_PING': True,
+        },
     }
 }
+# 只读库，部署时改为从库的连接配置并加入 DATABASE_REPLICAS；测试时镜像 default
+DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+# 只读库（library.routers）：列表页、导出、后台首页统计从这些库读取，写入和写入后的读取走 default。
+# 只读库的 TEST 需要设置 {'MIRROR': 'default'}
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['library.routers.PrimaryReplicaRouter']
+# 写入后多少秒内同一客户端的请求都读主库（覆盖复制延迟）
+REPLICA_PIN_SECONDS = 5
 
 
 # Password validation
@@ -131,3 +150,57 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'library/static')
 # MEDIA_URL = "/media/"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'library/media/')     # 设置静态文件路径为主目录下的media文件夹
+# 上传的导入文件和错误报告（library.importer），不能放在 MEDIA_ROOT 下，否则可以通过 /media/ 直接下载
+IMPORT_ROOT = os.path.join(BASE_DIR, 'imports')
+
+# 媒体文件发送方式: python（流式 FileResponse）、x-accel（nginx）、x-sendfile
+MEDIA_SERVE_MODE = 'python'
+# x-accel 模式下 nginx 中 internal location 的前缀
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# 请求性能统计（library.middleware.PerfMiddleware）
+# 抽样比例，1.0 表示记录所有请求；默认只记录 1%，开发环境（DEBUG）记录全部
+PERF_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+# 按 URL 名配置的预算，'*' 为默认预算
+PERF_BUDGETS = {
+    '*': {'queries': 50, 'ms': 1000},
+    'admin:library_checkout_changelist': {'queries': 10, 'ms': 500},
+    'admin:library_book_changelist': {'queries': 10, 'ms': 500},
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'perf': {'format': '%(asctime)s %(levelname)s %(message)s'},
+    },
+    'handlers': {
+        'perf': {'class': 'logging.StreamHandler', 'formatter': 'perf'},
+    },
+    'loggers': {
+        'library.perf': {'handlers': ['perf'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# 逾期每天的费用（charge_overdue 命令）
+OVERDUE_FEE_PER_DAY = '0.50'
+
+# 后台批量修改状态：每批行数，超过多少行转为后台任务
+BULK_BATCH_SIZE = 500
+BULK_BACKGROUND_THRESHOLD = 5000
+
+# 后台任务的租期（秒，library.jobs）：执行超过这么久的任务视为 worker 已退出，重新排队。应大于最长任务的执行时间
+JOB_TIMEOUT = 3600
+
+# 种类、书架参考数据缓存（library.refcache）：进程每隔多少秒检查一次版本号。
+# 多进程部署时 CACHES 需要使用共享缓存（如 memcached、redis），失效才能通知到所有进程
+REFCACHE_CHECK_SECONDS = 2
+
+# 后台自动完成结果的缓存时间（秒，library.autocomplete）
+AUTOCOMPLETE_CACHE_SECONDS = 60
+
+# 大表列表页（library.changelist）：总数超过这个值时显示估计值
+ADMIN_EXACT_COUNT_THRESHOLD = 10000
+
+# 归还超过多少天的借阅由 archive_loans 命令移到归档表（library.archive）
+ARCHIVE_AFTER_DAYS = 365
@@ -18,7 +18,7 @@ from django.urls import path, include
 
 from django.urls import path, re_path
 from django.conf import settings
-from django.views.static import serve
+from library.media import serve
 urlpatterns = [
     path('',  include('library.urls')),
     path('admin/', admin.site.urls),